@@ -79,6 +79,21 @@ try:
 except Exception as e:
     print(f"Failed to load Outpaint node: {e}")
 
+try:
+    from .nodes.folder_batch import KoukoutuFolderBatch
+    NODE_CLASS_MAPPINGS["KoukoutuFolderBatch"] = KoukoutuFolderBatch
+    NODE_DISPLAY_NAME_MAPPINGS["KoukoutuFolderBatch"] = "抠抠图-文件夹批处理"
+    print("Koukoutu Folder Batch node loaded successfully")
+except Exception as e:
+    print(f"Failed to load Folder Batch node: {e}")
+
+# Expose per-phase timing metrics on the ComfyUI server
+try:
+    from .metrics import register_routes
+    register_routes()
+except Exception as e:
+    print(f"Failed to register Koukoutu metrics route: {e}")
+
 if not NODE_CLASS_MAPPINGS:
     print("No Koukoutu nodes could be loaded. Please check your dependencies.")
 
@@ -0,0 +1,690 @@
+"""
+Koukoutu ComfyUI Nodes — API 调用流程
+同步抠图与异步任务（创建 → 轮询 → 下载）的公共实现，以及批量并发执行
+"""
+
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from .config import (
+        SYNC_API_URL,
+        SYNC_AUTH_HEADER,
+        SYNC_AUTH_PREFIX,
+        CREATE_REQUEST_TIMEOUT,
+        BATCH_MAX_WORKERS,
+        PIPELINE_ENCODE_WORKERS,
+        PIPELINE_UPLOAD_WORKERS,
+        PIPELINE_DOWNLOAD_WORKERS,
+        PIPELINE_QUEUE_SIZE,
+        ALPHA_OUTPUT_MODELS,
+    )
+from .client import http_post
+from .cache import result_key, cache_get, cache_put
+from .engine import get_engine
+from .ratelimit import get_rate_limiter, check_rate_limited, SYNC_CREATE
+from .keypool import call_with_key
+from .journal import resume_task, record_created, record_finished, record_discarded
+from .singleflight import get_flights, share, is_abandoned
+from .retry import call_with_retry
+from .interrupt import is_interrupted, raise_if_interrupted, interruptible_result
+from .upload import encode_for_upload, reuse_encoded
+from .handle import ResultItem, KoukoutuResult
+from .tiling import get_tile_policy, tile_boxes, split_tiles, blend_tiles
+from .errors import KoukoutuApiError, KoukoutuTaskError
+from .metrics import (
+        timed,
+        TENSOR_TO_PIL,
+        ENCODE,
+        CREATE,
+        DECODE,
+        PIL_TO_TENSOR,
+    )
+from .utils import (
+        quantize_tensor,
+        decode_image,
+        is_image_data,
+        _digest_pixels,
+        batch_fingerprints,
+        split_batch,
+        stack_batch,
+        code_dict
+    )
+
+
+def _sync_task_once(api_key, data, upload):
+    headers = {
+        SYNC_AUTH_HEADER: f"{SYNC_AUTH_PREFIX}{api_key}"
+    }
+    files = {
+        'image_file': upload
+    }
+    get_rate_limiter().acquire(api_key, SYNC_CREATE)
+    with timed(CREATE, data['model_key']):
+        response = http_post(
+            SYNC_API_URL,
+            headers=headers,
+            data=data,
+            files=files,
+            timeout=CREATE_REQUEST_TIMEOUT
+        )
+    check_rate_limited(response, api_key, SYNC_CREATE)
+    content_type = response.headers.get('content-type', '')
+    if 'application/json' in content_type:
+        json_response = response.json()
+        code = json_response.get('code', response.status_code)
+        check_rate_limited(response, api_key, SYNC_CREATE, code)
+        raise KoukoutuApiError(
+            code_dict.get(code, f"API 错误: {json_response.get('message', '未知错误')}"),
+            code
+        )
+    # 网关错误页等非 JSON 响应：5xx 按状态码重试，绝不能当作结果写入缓存
+    if response.status_code != 200:
+        raise KoukoutuApiError(f"抠图请求失败，HTTP {response.status_code}", response.status_code)
+    if not content_type.startswith('image/'):
+        raise KoukoutuApiError(f"抠图请求返回的不是图像: {content_type or '未知类型'}")
+    if not is_image_data(response.content):
+        raise KoukoutuApiError("抠图请求返回的图像数据无法识别")
+    return response.content
+
+
+def _encode(pil_image, model_key):
+    with timed(ENCODE, model_key):
+        return encode_for_upload(pil_image, model_key)
+
+
+def _quantize(image, model_key):
+    """
+    Quantize a whole IMAGE batch once; the uint8 pixels feed both the
+    fingerprints and the upload encoding of every item
+    """
+    with timed(TENSOR_TO_PIL, model_key):
+        return quantize_tensor(image if len(image.shape) == 4 else image.unsqueeze(0))
+
+
+def _decode(result, model_key):
+    with timed(DECODE, model_key):
+        return decode_image(result)
+
+
+def _stack(images, model_key):
+    """
+    Returns:
+        tuple: (IMAGE batch, MASK of valid pixels, alpha MASK or None)
+    """
+    with timed(PIL_TO_TENSOR, model_key):
+        return stack_batch(images, with_alpha=model_key in ALPHA_OUTPUT_MODELS)
+
+
+def fetch_sync(api_key, data, upload, key, decode=True):
+    """
+    Run one synchronous request for an encoded upload and cache the result
+
+    Identical requests running at the same time (other prompts, other
+    threads) share one API call through the single-flight registry.
+
+    Returns:
+        tuple: (raw result bytes, decoded PIL Image or None if decode is off)
+    """
+    def fetch():
+        result, _ = call_with_key(api_key, SYNC_CREATE, lambda key: call_with_retry(
+            lambda: _sync_task_once(key, data, upload), "抠图请求", CREATE, data['model_key']
+        ))
+        cache_put(key, result)
+        return result
+
+    result = share(key, fetch)
+    return result, _decode(result, data['model_key']) if decode else None
+
+
+def _upload_source(source, model_key):
+    """
+    Encode one batch item for upload
+
+    Quantized pixels are encoded by the upload policy. A ResultItem (the
+    encoded output of a previous Koukoutu node) is forwarded as it is when
+    it fits the policy, and only decoded and re-encoded otherwise.
+    """
+    if isinstance(source, ResultItem):
+        upload = reuse_encoded(source.data, model_key)
+        if upload is not None:
+            return upload
+        return _encode(_decode(source.data, model_key), model_key)
+    return _encode(Image.fromarray(source), model_key)
+
+
+def _lookup(digest, data, api_key=None):
+    """
+    Look one batch item up in the result cache and, for async tasks (when
+    api_key is given), in the job journal
+
+    Returns:
+        tuple: (cache key, cached result or None,
+                journal entry to resume (see journal.resume_task) or None)
+    """
+    key = result_key(digest, data)
+    cached = cache_get(key)
+    if cached is not None:
+        return key, cached, None
+    resume = resume_task(key, api_key) if api_key is not None else None
+    return key, None, resume
+
+
+def prepare_upload(source, digest, data, api_key=None):
+    """
+    Look one batch item up (see _lookup) and encode it for upload only when
+    neither the cache nor the journal has it
+
+    Returns:
+        tuple: (cache key, upload or None, cached result or None, journal entry or None)
+    """
+    key, cached, resume = _lookup(digest, data, api_key)
+    if cached is not None or resume is not None:
+        return key, None, cached, resume
+    return key, _upload_source(source, data['model_key']), None, None
+
+
+def _dedup(digests):
+    """
+    Find exact duplicates within a batch
+
+    Returns:
+        tuple: (index of the first occurrence of every distinct digest,
+                position in that list of every item)
+    """
+    first = {}
+    unique = []
+    positions = []
+    for index, digest in enumerate(digests):
+        if digest not in first:
+            first[digest] = len(unique)
+            unique.append(index)
+        positions.append(first[digest])
+    return unique, positions
+
+
+def _batch_sources(image, result, model_key):
+    """
+    Collect the items a node sends to the API
+
+    With a KOUKOUTU_RESULT handle connected, its encoded results are used
+    instead of the IMAGE input; items of the handle that fell back to their
+    input tensor are quantized like an IMAGE batch.
+
+    Returns:
+        tuple: (sources, image digests, fallbacks returned for failed items)
+    """
+    if result is not None:
+        sources = []
+        digests = []
+        for item in result.items:
+            if isinstance(item, ResultItem):
+                sources.append(item)
+                digests.append(item.digest)
+            else:
+                pixels = _quantize(item, model_key)
+                sources.append(pixels[0])
+                digests.append(batch_fingerprints(item, pixels)[0])
+        return sources, digests, list(result.items)
+    if image is None:
+        raise ValueError("请连接 image 或 result 输入")
+    pixels = _quantize(image, model_key)
+    return list(pixels), batch_fingerprints(image, pixels), split_batch(image)
+
+
+def _outputs(items, images, model_key):
+    """
+    Build the IMAGE / MASK / alpha outputs and the KOUKOUTU_RESULT handle
+
+    Args:
+        items: ResultItem of every item, or the fallback of a failed item
+        images: decoded PIL Image of every successful item (None otherwise)
+
+    Returns:
+        tuple: (IMAGE, MASK, alpha MASK or None, KoukoutuResult)
+    """
+    decoded = []
+    for item, image in zip(items, images):
+        if image is None:
+            # 失败项的回退：输入张量直接写入批次，上游结果句柄则需要先解码
+            image = _decode(item.data, model_key) if isinstance(item, ResultItem) else item
+        decoded.append(image)
+    image_batch, mask, alpha = _stack(decoded, model_key)
+    return image_batch, mask, alpha, KoukoutuResult(items)
+
+
+def run_batch(items, process_one, max_workers=BATCH_MAX_WORKERS):
+    """
+    Apply process_one(index, item) to every item with bounded concurrency
+
+    Results are returned in input order. The first exception is re-raised
+    and items that have not started yet are cancelled. The calling thread
+    returns as soon as the prompt is interrupted, even for a single item;
+    requests already sent finish in the background and land in the result cache.
+    """
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items))))
+    try:
+        futures = [executor.submit(process_one, i, item) for i, item in enumerate(items)]
+        return [interruptible_result(future) for future in futures]
+    finally:
+        executor.shutdown(wait=not is_interrupted(), cancel_futures=True)
+
+
+class _BatchProgress:
+    """
+    Aggregate per-item task progress into one ComfyUI progress bar
+
+    Reporters run on the engine loop and only record the values. flush()
+    pushes them to the bar from the node's own thread, where ComfyUI's
+    progress hook finds the executing node (see TaskEngine.run's on_wait).
+    """
+
+    def __init__(self, count):
+        self.total = 100 * count
+        self.values = [0] * count
+        self.lock = threading.Lock()
+        self.shown = 0
+        # 延迟导入：folder.run_folder 与命令行工具不经过这里，无需 ComfyUI 也能运行
+        import comfy.utils
+        self.pbar = comfy.utils.ProgressBar(self.total)
+
+    def reporter(self, index):
+        def report(value):
+            with self.lock:
+                self.values[index] = value
+        return report
+
+    def flush(self):
+        with self.lock:
+            value = sum(self.values)
+        if value == self.shown:
+            return
+        # ComfyUI 的进度钩子遇到中断时会清除中断标志，先自行检查（不清除），
+        # 其他同时等待的 Koukoutu 节点因此同样能看到中断
+        raise_if_interrupted()
+        self.shown = value
+        self.pbar.update_absolute(value, self.total)
+
+
+def _join_messages(messages):
+    if len(messages) == 1:
+        return messages[0]
+    return "\n".join(f"[{i}] {message}" for i, message in enumerate(messages))
+
+
+def run_sync_batch(image, api_key, data, result=None):
+    """
+    Run a synchronous request for every image of an IMAGE batch
+
+    Args:
+        image: IMAGE batch, or None when result is given
+        result: KOUKOUTU_RESULT handle of a previous node, used instead of image
+
+    Returns:
+        tuple: (RGB IMAGE batch, MASK of valid pixels), followed by the alpha
+               MASK for models in ALPHA_OUTPUT_MODELS and the KOUKOUTU_RESULT handle
+    """
+    model_key = data['model_key']
+    sources, digests, _ = _batch_sources(image, result, model_key)
+    # 批次内完全相同的图像只请求一次，结果按位置分发
+    unique, positions = _dedup(digests)
+
+    def process_one(_, index):
+        key, upload, cached, _ = prepare_upload(sources[index], digests[index], data)
+        if cached is None:
+            return fetch_sync(api_key, data, upload, key)
+        return cached, _decode(cached, model_key)
+
+    results = run_batch(unique, process_one)
+    outcomes = [results[p] for p in positions]
+    image_batch, mask, alpha, handle = _outputs(
+        [ResultItem(raw) for raw, _ in outcomes], [image for _, image in outcomes], model_key
+    )
+    if model_key not in ALPHA_OUTPUT_MODELS:
+        return image_batch, mask, handle
+    return image_batch, mask, alpha, handle
+
+
+class _AsyncPipeline:
+    """
+    Staged pipeline running the async tasks of one IMAGE batch
+
+    Encode, upload, poll and download/decode run as separate stages joined
+    by bounded queues: image N+1 is encoded while image N uploads, and
+    finished results are downloaded and decoded while other tasks are still
+    polling. The queues cap how many encoded uploads and finished results are
+    held at once, and at most BATCH_MAX_WORKERS tasks are in flight on the server.
+
+    Created tasks are recorded in the job journal. Items whose task was
+    created before a restart resume polling (or go straight to the download)
+    instead of being submitted again; if the old task can no longer be
+    queried or downloaded, the item is submitted again.
+
+    An item whose identical request (same digest and parameters) is already
+    in flight in another prompt or folder job follows that request through
+    the single-flight registry instead of creating a task of its own.
+    """
+
+    def __init__(self, engine, api_key, data, sources, digests, progress, skip_error):
+        self.engine = engine
+        self.api_key = api_key
+        self.data = data
+        self.model_key = data['model_key']
+        self.sources = sources
+        self.digests = digests
+        self.progress = progress
+        self.skip_error = skip_error
+        self.outcomes = [None] * len(sources)
+
+    async def run(self):
+        """
+        Returns:
+            list: (ResultItem or None, decoded PIL Image or None, message) of
+                  every item, in order
+        """
+        self._encoded = asyncio.Queue(PIPELINE_QUEUE_SIZE)
+        self._finished = asyncio.Queue(PIPELINE_QUEUE_SIZE)
+        self._in_flight = asyncio.Semaphore(BATCH_MAX_WORKERS)
+        # 各编码协程共享同一个索引迭代器，每张图像只会被取出一次
+        self._indices = iter(range(len(self.outcomes)))
+        self._remaining = len(self.outcomes)
+        self._done = asyncio.get_running_loop().create_future()
+        self._tasks = set()
+        # 本流水线作为发起方、尚未发布结果的请求
+        self._leading = set()
+
+        for stage, count in ((self._encode_stage, PIPELINE_ENCODE_WORKERS),
+                             (self._upload_stage, PIPELINE_UPLOAD_WORKERS),
+                             (self._download_stage, PIPELINE_DOWNLOAD_WORKERS)):
+            for _ in range(count):
+                self._spawn(stage())
+        try:
+            await self._done
+        finally:
+            for task in list(self._tasks):
+                task.cancel()
+            for key in self._leading:
+                get_flights().resolve(key, error=asyncio.CancelledError())
+        return self.outcomes
+
+    def _publish(self, key, result=None, error=None):
+        if key in self._leading:
+            self._leading.discard(key)
+            get_flights().resolve(key, result, error)
+
+    def _spawn(self, coro):
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
+
+    def _task_done(self, task):
+        self._tasks.discard(task)
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None and not self._done.done():
+            self._done.set_exception(error)
+
+    def _complete(self, index, item, image, message):
+        self.outcomes[index] = (item, image, message)
+        self._remaining -= 1
+        if self._remaining == 0 and not self._done.done():
+            self._done.set_result(None)
+
+    async def _encode_stage(self):
+        for index in self._indices:
+            await self._start(index)
+
+    async def _start(self, index):
+        key, cached, resume = await self.engine.run_blocking(
+            _lookup, self.digests[index], self.data, self.api_key
+        )
+        if cached is not None:
+            await self._finished.put((index, key, None, cached, False))
+            return
+        if resume is not None:
+            task_id, api_key, result_file = resume
+            print(f"[Koukoutu] 恢复重启前创建的任务 {task_id}")
+            if result_file is not None:
+                await self._finished.put((index, key, result_file, None, True))
+            else:
+                # 任务已在服务端运行，不占用 BATCH_MAX_WORKERS 的并发名额
+                self._spawn(self._poll_stage(index, key, task_id, api_key, True))
+            return
+        future, leader = get_flights().join(key)
+        if not leader:
+            self._spawn(self._follow(index, key, future))
+            return
+        self._leading.add(key)
+        upload = await self.engine.run_blocking(_upload_source, self.sources[index], self.model_key)
+        await self._encoded.put((index, key, upload))
+
+    async def _follow(self, index, key, future):
+        """
+        Wait for an identical request of another prompt or job
+        """
+        try:
+            raw = await asyncio.wrap_future(future)
+        except KoukoutuTaskError as e:
+            if not self.skip_error:
+                raise
+            self._complete(index, None, None, str(e))
+            return
+        except Exception as e:
+            if not is_abandoned(e):
+                raise
+            # 发起方中途放弃（取消或因其自身的 Key 等原因失败），由本流水线自行请求
+            await self._start(index)
+            return
+        await self._finished.put((index, key, None, raw, False))
+
+    async def _resubmit(self, index, key, error):
+        """
+        Submit an item again after its journaled task could not be resumed
+
+        Runs as its own task so the stage that found the problem never
+        blocks on the bounded upload queue.
+        """
+        print(f"[Koukoutu] 无法恢复任务，重新提交: {error}")
+        await self.engine.run_blocking(record_discarded, key)
+        upload = await self.engine.run_blocking(_upload_source, self.sources[index], self.model_key)
+        await self._encoded.put((index, key, upload))
+
+    async def _upload_stage(self):
+        while True:
+            index, key, upload = await self._encoded.get()
+            await self._in_flight.acquire()
+            try:
+                task_id, api_key = await self.engine.submit_task(self.api_key, self.data, upload)
+                await self.engine.run_blocking(
+                    record_created, key, self.digests[index], self.data, task_id, api_key
+                )
+            except BaseException:
+                self._in_flight.release()
+                raise
+            self._spawn(self._poll_stage(index, key, task_id, api_key))
+
+    async def _poll_stage(self, index, key, task_id, api_key, resumed=False):
+        try:
+            result_file = await self.engine.wait(
+                api_key, task_id, self.data, self.progress.reporter(index),
+                functools.partial(record_discarded, key), resumed
+            )
+        except KoukoutuTaskError as e:
+            self._publish(key, error=e)
+            await self.engine.run_blocking(record_discarded, key)
+            if not self.skip_error:
+                raise
+            self._complete(index, None, None, str(e))
+            return
+        except KoukoutuApiError as e:
+            if not resumed:
+                raise
+            self._spawn(self._resubmit(index, key, e))
+            return
+        finally:
+            if not resumed:
+                self._in_flight.release()
+        await self.engine.run_blocking(record_finished, key, result_file)
+        await self._finished.put((index, key, result_file, None, resumed))
+
+    async def _download_stage(self):
+        while True:
+            index, key, result_file, cached, resumed = await self._finished.get()
+            if cached is not None:
+                raw = cached
+                image = await self.engine.run_blocking(_decode, cached, self.model_key)
+            else:
+                try:
+                    raw, image = await self.engine.fetch_result(result_file, self.model_key)
+                except KoukoutuApiError as e:
+                    if not resumed:
+                        raise
+                    # 重启前的结果地址可能已过期
+                    self._spawn(self._resubmit(index, key, e))
+                    continue
+                await self.engine.run_blocking(cache_put, key, raw)
+                self._publish(key, raw)
+            self.progress.reporter(index)(100)
+            self._complete(index, ResultItem(raw, result_file), image, "成功")
+
+
+def _run_pipeline(api_key, data, sources, digests, skip_error):
+    """
+    Run the async pipeline once per distinct item and fan the outcomes out
+
+    Exact duplicates within the batch (same digest) are submitted once.
+
+    Returns:
+        list: (ResultItem or None, decoded PIL Image or None, message) of every item
+    """
+    unique, positions = _dedup(digests)
+    engine = get_engine()
+    pipeline = _AsyncPipeline(
+        engine, api_key, data, [sources[i] for i in unique], [digests[i] for i in unique],
+        _BatchProgress(len(unique)), skip_error
+    )
+    outcomes = engine.run(pipeline.run(), on_wait=pipeline.progress.flush)
+    pipeline.progress.flush()
+    return [outcomes[p] for p in positions]
+
+
+def run_async_batch(image, api_key, data, skip_error=True, result=None):
+    """
+    Run an async task for every image of an IMAGE batch concurrently
+
+    The items go through a staged pipeline on the shared engine loop (see
+    _AsyncPipeline). Items already in the result cache are served without
+    touching the network. Failed tasks (state=2) fall back to the original
+    image when skip_error is set; otherwise the error is raised.
+
+    Args:
+        image: IMAGE batch, or None when result is given
+        result: KOUKOUTU_RESULT handle of a previous node, used instead of image
+
+    Returns:
+        tuple: (RGB IMAGE batch, message, MASK of valid pixels), followed by
+               the alpha MASK for models in ALPHA_OUTPUT_MODELS and the
+               KOUKOUTU_RESULT handle
+    """
+    model_key = data['model_key']
+    sources, digests, fallbacks = _batch_sources(image, result, model_key)
+    outcomes = _run_pipeline(api_key, data, sources, digests, skip_error)
+
+    items = []
+    images = []
+    messages = []
+    for fallback, (item, decoded, message) in zip(fallbacks, outcomes):
+        # 结果保持为已解码的 PIL Image，由 stack_batch 直接写入最终的批次张量
+        items.append(fallback if item is None else item)
+        images.append(decoded)
+        messages.append(message)
+
+    image_batch, mask, alpha, handle = _outputs(items, images, model_key)
+    if model_key not in ALPHA_OUTPUT_MODELS:
+        return image_batch, _join_messages(messages), mask, handle
+    return image_batch, _join_messages(messages), mask, alpha, handle
+
+
+def _batch_pixels(image, result, model_key):
+    """
+    Quantized pixels [H, W, 3] of every item of an IMAGE batch or a
+    KOUKOUTU_RESULT handle, with the fallback returned for failed items
+    """
+    if result is None:
+        if image is None:
+            raise ValueError("请连接 image 或 result 输入")
+        return list(_quantize(image, model_key)), split_batch(image)
+    pixels = []
+    for item in result.items:
+        if isinstance(item, ResultItem):
+            pixels.append(np.asarray(_decode(item.data, model_key).convert("RGB")))
+        else:
+            pixels.append(_quantize(item, model_key)[0])
+    return pixels, list(result.items)
+
+
+def run_tiled_batch(image, api_key, data, skip_error=True, result=None):
+    """
+    Run an async task per overlapping tile of every image and blend the results
+
+    The tiles of the whole batch go through one _AsyncPipeline, so they are
+    processed concurrently and each tile is cached and journaled on its own;
+    identical tiles (e.g. flat background) are submitted once.
+    Tile size and overlap come from TILE_POLICIES. An image with a failed
+    tile falls back to the original image when skip_error is set.
+
+    Returns:
+        tuple: (RGB IMAGE batch, message, MASK of valid pixels, KOUKOUTU_RESULT handle)
+    """
+    model_key = data['model_key']
+    policy = get_tile_policy(model_key)
+    if policy is None:
+        raise ValueError(f"模型 {model_key} 不支持分块处理")
+    pixels, fallbacks = _batch_pixels(image, result, model_key)
+
+    layouts = []
+    sources = []
+    for item in pixels:
+        boxes = tile_boxes(item.shape[0], item.shape[1], policy["tile"], policy["overlap"])
+        layouts.append((len(sources), boxes))
+        sources.extend(split_tiles(item, boxes))
+
+    outcomes = _run_pipeline(api_key, data, sources, [_digest_pixels(tile) for tile in sources], skip_error)
+
+    items = []
+    messages = []
+    for fallback, item, (start, boxes) in zip(fallbacks, pixels, layouts):
+        tiles = outcomes[start:start + len(boxes)]
+        errors = [f"分块 {i}: {message}" for i, (tile, _, message) in enumerate(tiles) if tile is None]
+        if errors:
+            items.append(fallback)
+            messages.append("; ".join(errors))
+            continue
+        with timed(PIL_TO_TENSOR, model_key):
+            blended = blend_tiles(
+                [decoded for _, decoded, _ in tiles], boxes, item.shape[0], item.shape[1], policy["overlap"]
+            )
+        items.append(blended)
+        messages.append(f"成功（{len(boxes)} 个分块）")
+
+    image_batch, mask, _, handle = _outputs(items, [None] * len(items), model_key)
+    return image_batch, _join_messages(messages), mask, handle
+
+
+async def run_in_thread(func, *args, **kwargs):
+    """
+    Await a blocking batch function from a coroutine node
+
+    The function runs in a worker thread with a copy of the caller's context
+    variables, so while it waits on the engine loop the executor goes on with
+    other nodes of the prompt. ComfyUI's executing-node context is among those
+    variables: progress bars are created and updated on this worker thread
+    (the engine loop only records progress, see TaskEngine.run's on_wait),
+    so concurrent Koukoutu branches each report on their own node.
+    """
+    return await asyncio.to_thread(func, *args, **kwargs)
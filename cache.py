@@ -0,0 +1,151 @@
+"""
+Koukoutu ComfyUI Nodes — 本地结果缓存
+以（输入图像摘要, model_key, 规范化参数）为键，将 API 返回的结果图像字节保存在磁盘上，
+ComfyUI 重启或换一个工作流后相同请求也能直接命中，不再上传、计费和等待
+"""
+
+import os
+import json
+import hashlib
+import threading
+
+from .config import (
+        RESULT_CACHE_ENABLED,
+        RESULT_CACHE_DIR,
+        RESULT_CACHE_MAX_BYTES,
+    )
+
+
+def result_key(image_digest, data):
+    """
+    Build the cache key of a request
+
+    Args:
+        image_digest: digest of the input image
+        data: form fields, including model_key
+
+    Returns:
+        str: hex key
+    """
+    params = {str(name): str(value) for name, value in data.items()}
+    payload = json.dumps([image_digest, params], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """
+    Size-bounded on-disk LRU cache of result bytes
+
+    Entries are plain files; the modification time is refreshed on every hit
+    and the least recently used files are removed once the total size
+    exceeds max_bytes.
+    """
+
+    def __init__(self, directory=RESULT_CACHE_DIR, max_bytes=RESULT_CACHE_MAX_BYTES):
+        self._dir = directory
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size = None
+
+    def _path(self, key):
+        return os.path.join(self._dir, key[:2], key)
+
+    def _entries(self):
+        entries = []
+        if not os.path.isdir(self._dir):
+            return entries
+        for bucket in os.scandir(self._dir):
+            if not bucket.is_dir():
+                continue
+            for entry in os.scandir(bucket.path):
+                if entry.is_file() and not entry.name.endswith('.tmp'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _current_size(self):
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._entries())
+        return self._size
+
+    def get(self, key):
+        """
+        Return the cached bytes for key, or None on a miss
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = f.read()
+            os.utime(path)
+            return value
+        except OSError:
+            return None
+
+    def put(self, key, value):
+        """
+        Store value under key and evict old entries if over the size limit
+        """
+        path = self._path(key)
+        with self._lock:
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                old_size = os.path.getsize(path) if os.path.exists(path) else 0
+                temp_path = f"{path}.{threading.get_ident()}.tmp"
+                with open(temp_path, 'wb') as f:
+                    f.write(value)
+                os.replace(temp_path, path)
+                self._size = self._current_size() - old_size + len(value)
+                if self._size > self._max_bytes:
+                    self._evict()
+            except OSError as e:
+                print(f"[Koukoutu] 写入结果缓存失败: {e}")
+
+    def _evict(self):
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        # 淘汰到上限的 90%，避免每次写入都触发目录扫描
+        target = self._max_bytes * 0.9
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+            except OSError:
+                pass
+        self._size = total
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    """
+    Return the process-wide result cache, or None if caching is disabled
+    """
+    global _cache
+    if not RESULT_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResultCache()
+    return _cache
+
+
+def cache_get(key):
+    """
+    Look up key in the result cache (always a miss when caching is disabled)
+    """
+    cache = get_result_cache()
+    return cache.get(key) if cache is not None else None
+
+
+def cache_put(key, value):
+    """
+    Store value in the result cache (no-op when caching is disabled)
+    """
+    cache = get_result_cache()
+    if cache is not None:
+        cache.put(key, value)
@@ -0,0 +1,60 @@
+"""
+Koukoutu ComfyUI Nodes — 共享 HTTP 客户端
+所有节点复用同一个带连接池的 requests.Session，创建任务、轮询与结果下载
+都走 keep-alive 连接，避免每个请求重新进行 TCP + TLS 握手
+"""
+
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .config import HTTP_POOL_CONNECTIONS, HTTP_POOL_MAXSIZE
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def _build_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=HTTP_POOL_CONNECTIONS,
+        pool_maxsize=HTTP_POOL_MAXSIZE,
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session():
+    """
+    Return the process-wide pooled session, creating it on first use
+
+    The session is shared by every node and every concurrently executing
+    prompt. urllib3 connection pools are thread-safe; the session carries no
+    per-request state (auth is passed per call), so reuse across threads is safe.
+
+    Returns:
+        requests.Session
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def http_post(url, **kwargs):
+    """
+    POST through the shared pooled session (same signature as requests.post)
+    """
+    return get_session().post(url, **kwargs)
+
+
+def http_get(url, **kwargs):
+    """
+    GET through the shared pooled session (same signature as requests.get)
+    """
+    return get_session().get(url, **kwargs)
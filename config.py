@@ -3,14 +3,43 @@ Koukoutu ComfyUI Nodes — 公共配置
 所有节点共享的 API 地址、错误码、重试策略等常量集中管理于此
 """
 
+import os
+
+# ====================== 本地数据目录 ======================
+
+# 轮询历史等本地持久化数据的存放目录，可通过环境变量 KOUKOUTU_DATA_DIR 覆盖
+DATA_DIR = os.environ.get(
+    "KOUKOUTU_DATA_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".koukoutu"),
+)
+
 # ====================== API 端点 ======================
 
+# 可通过环境变量覆盖 API 地址，例如指向本地模拟服务（tools/mock_server.py）：
+#   KOUKOUTU_API_BASE=http://127.0.0.1:8765 同时覆盖同步（/sync）与异步（/async）地址
+#   KOUKOUTU_SYNC_BASE / KOUKOUTU_ASYNC_BASE 分别覆盖
+_API_BASE = os.environ.get("KOUKOUTU_API_BASE", "").rstrip("/")
+SYNC_API_BASE = os.environ.get(
+    "KOUKOUTU_SYNC_BASE",
+    f"{_API_BASE}/sync" if _API_BASE else "https://sync.koukoutu.com",
+).rstrip("/")
+ASYNC_API_BASE = os.environ.get(
+    "KOUKOUTU_ASYNC_BASE",
+    f"{_API_BASE}/async" if _API_BASE else "https://async.koukoutu.com",
+).rstrip("/")
+
 # 同步 API（用于抠图等即时返回的接口）
-SYNC_API_URL = "https://sync.koukoutu.com/v1/create"
+SYNC_API_URL = f"{SYNC_API_BASE}/v1/create"
 
 # 异步 API（用于印花裁切、扩图、去水印等需要轮询的接口）
-ASYNC_CREATE_URL = "https://async.koukoutu.com/v1/create"
-ASYNC_QUERY_URL  = "https://async.koukoutu.com/v1/query"
+ASYNC_CREATE_URL = f"{ASYNC_API_BASE}/v1/create"
+ASYNC_QUERY_URL  = f"{ASYNC_API_BASE}/v1/query"
+
+# 取消异步任务（可选，见 CANCEL_REMOTE_TASKS），本地模拟服务（tools/mock_server.py）实现了该接口
+ASYNC_CANCEL_URL = f"{ASYNC_API_BASE}/v1/cancel"
+
+# 走同步 API 的模型，其余模型均为异步任务
+SYNC_MODELS = ("background-removal", "stamp-background-removal")
 
 # ====================== 认证方式 ======================
 
@@ -26,15 +55,113 @@ ASYNC_AUTH_HEADER = "X-API-Key"
 # 服务器类错误，可自动重试
 RETRY_STATUS_CODES = [500, 502, 503, 504]
 
-# 最大重试次数
+# 请求过于频繁，按 Retry-After（或默认暂停时间）等待后重试
+RATE_LIMITED_CODE = 429
+
+# 每个阶段（创建、查询、下载）的最大重试次数
 MAX_RETRY_COUNT = 5
 
-# 异步轮询间隔（秒）
+# 重试退避的初始间隔与上限（秒），每次重试间隔翻倍并加入随机抖动
+RETRY_BACKOFF_BASE = 1
+RETRY_BACKOFF_MAX = 30
+
+# 异步轮询间隔（秒），没有历史耗时可参考时用作首次查询的等待时间
 DEFAULT_POLL_INTERVAL = 1
 
 # 异步任务最大等待时间（秒）
 DEFAULT_MAX_WAIT = 300
 
+# ====================== 批量处理 ======================
+
+# IMAGE 批次中同时提交的最大任务数（异步模型为同时在服务端处理的任务数）
+BATCH_MAX_WORKERS = 4
+
+# 异步批次流水线：编码、上传、下载解码各阶段的工作协程数
+PIPELINE_ENCODE_WORKERS = 2
+PIPELINE_UPLOAD_WORKERS = 2
+PIPELINE_DOWNLOAD_WORKERS = 4
+
+# 阶段之间队列的容量，限制已编码待上传、已完成待下载的图像数，从而限制内存占用
+PIPELINE_QUEUE_SIZE = 2
+
+# ====================== 文件夹批处理 ======================
+
+# 文件夹批处理同时处理的图像数（读取、上传、等待、写入），内存占用只与该值有关
+FOLDER_MAX_WORKERS = 8
+
+# 输入目录中参与处理的文件扩展名
+FOLDER_IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".bmp")
+
+# 汇总信息中最多列出的失败文件数
+FOLDER_ERROR_SAMPLES = 20
+
+# ====================== 异步任务引擎 ======================
+
+# 引擎执行阻塞 HTTP 请求（创建、查询、下载）的线程数
+ENGINE_IO_WORKERS = 16
+
+# ====================== 自适应轮询 ======================
+
+# 两次查询之间的最短 / 最长间隔（秒）
+MIN_POLL_INTERVAL = 0.5
+MAX_POLL_INTERVAL = 15
+
+# 首次查询安排在历史耗时中位数的该比例处
+FIRST_POLL_FRACTION = 0.9
+
+# 无进度信息且已超出预期耗时时，查询间隔的退避倍数
+POLL_BACKOFF_FACTOR = 1.5
+
+# 查询间隔的随机抖动比例（±）
+POLL_JITTER = 0.1
+
+# 每个模型保留的最近完成耗时条数
+POLL_HISTORY_SIZE = 20
+
+# 影响耗时、需要区分历史记录的参数（例如 4k 与 1k 分开统计）
+POLL_HISTORY_PARAMS = ("resolution", "scale")
+
+# 各模型完成耗时历史的持久化文件
+POLL_HISTORY_FILE = os.path.join(DATA_DIR, "poll_history.json")
+
+# ====================== 结果缓存 ======================
+
+# 是否启用本地结果缓存（相同图像 + 相同参数直接返回已下载的结果，不再请求 API），
+# 设置环境变量 KOUKOUTU_RESULT_CACHE=0 可关闭（例如压测时）
+RESULT_CACHE_ENABLED = os.environ.get("KOUKOUTU_RESULT_CACHE", "1") != "0"
+
+# 结果缓存目录
+RESULT_CACHE_DIR = os.path.join(DATA_DIR, "cache")
+
+# 结果缓存总大小上限（字节），超出后按最近最少使用淘汰
+RESULT_CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+# ====================== 任务日志 ======================
+
+# 是否启用任务日志：记录每个已创建的异步任务（输入摘要、model_key、参数、task_id、状态、结果地址），
+# ComfyUI 重启后重新执行同一批次时继续轮询未完成的任务、直接下载已完成的结果，而不是重新提交计费；
+# 设置环境变量 KOUKOUTU_JOB_JOURNAL=0 可关闭
+JOB_JOURNAL_ENABLED = os.environ.get("KOUKOUTU_JOB_JOURNAL", "1") != "0"
+
+# 任务日志文件（SQLite）
+JOB_JOURNAL_FILE = os.path.join(DATA_DIR, "jobs.sqlite3")
+
+# 任务日志条目的保留时间（秒），超过后视为失效（结果地址通常也已过期）
+JOB_JOURNAL_MAX_AGE = 7 * 24 * 3600
+
+# ====================== 中断处理 ======================
+
+# 检查 ComfyUI 中断标志（取消 prompt）的间隔（秒），即取消后停止等待的最大延迟
+INTERRUPT_CHECK_INTERVAL = 0.05
+
+# 流式下载结果时每次读取的字节数，中断时在两次读取之间放弃下载
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# 取消 prompt 时是否同时向 ASYNC_CANCEL_URL 发送取消请求，停止服务端仍在运行的任务；
+# 默认关闭：任务继续在服务端运行并保留在任务日志中，重新执行时直接继续轮询，不重复提交计费。
+# 设置环境变量 KOUKOUTU_CANCEL_REMOTE=1 开启
+CANCEL_REMOTE_TASKS = os.environ.get("KOUKOUTU_CANCEL_REMOTE", "0") == "1"
+
 # ====================== 请求超时 ======================
 
 # 创建任务请求超时（秒）
@@ -46,6 +173,97 @@ QUERY_REQUEST_TIMEOUT = 30
 # 下载结果图像超时（秒）
 DOWNLOAD_REQUEST_TIMEOUT = 60
 
+# ====================== 客户端限流 ======================
+
+# 每个 API Key 在各接口上的请求速率（次/秒）与突发容量，所有节点与并发 prompt 共享
+RATE_LIMITS = {
+    "sync_create":  {"rate": 5, "burst": 5},
+    "async_create": {"rate": 5, "burst": 5},
+    "query":        {"rate": 20, "burst": 20},
+}
+
+# 收到 429 但响应未携带 Retry-After 时的暂停时间（秒）
+RATE_LIMIT_DEFAULT_PAUSE = 2
+
+# ====================== API Key 池 ======================
+
+# 节点的 api_key 留空时，每个请求从 Key 池中选择 Key：
+# 环境变量 KOUKOUTU_API_KEYS（逗号或换行分隔），以及 API_KEYS_FILE 文件（每行一个，# 开头为注释）
+API_KEYS = os.environ.get("KOUKOUTU_API_KEYS", "")
+API_KEYS_FILE = os.environ.get("KOUKOUTU_API_KEYS_FILE", os.path.join(DATA_DIR, "api_keys.txt"))
+
+# 返回这些错误码时，认为 Key 无效或积分/额度已用完，暂停该 Key 并换用池中的下一个 Key
+KEY_RETIRE_CODES = (401, 403, 409)
+
+# 被暂停的 Key 多久后重新参与选择（秒），充值后无需重启即可恢复
+KEY_RETIRE_SECONDS = 3600
+
+# ====================== 连接池 ======================
+
+# 缓存的主机连接池数量（同步 API、异步 API、结果文件 CDN 等）
+HTTP_POOL_CONNECTIONS = 8
+
+# 每个主机连接池保留的最大 keep-alive 连接数（应不小于并发任务数）
+HTTP_POOL_MAXSIZE = 32
+
+# ====================== 性能指标 ======================
+
+# Prometheus 文本格式指标的 ComfyUI 路由
+METRICS_ROUTE = "/koukoutu/metrics"
+
+# 各阶段耗时直方图的桶上界（秒）
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# ====================== 上传策略 ======================
+
+# 上传文件大小上限（字节），API 对超过 15M 的文件返回 406/413
+UPLOAD_MAX_BYTES = 15 * 1000 * 1000
+
+# 各模型上传时使用的编码格式与参数：
+#   format:    PNG / JPEG / WEBP
+#   quality:   JPEG / 有损 WEBP 的质量
+#   lossless:  WEBP 是否无损
+#   compress_level: PNG 压缩级别（0-9，越低编码越快、文件越大）
+#   max_side:  上传前将长边缩小到该像素值（None 表示仅在超出大小上限时缩小）
+# 需要保留透明图层或细节的模型使用无损格式，其余使用高质量 JPEG
+UPLOAD_POLICIES = {
+    "background-removal":       {"format": "JPEG", "quality": 95, "max_side": None},
+    "stamp-background-removal": {"format": "JPEG", "quality": 95, "max_side": None},
+    "stamp-crop":               {"format": "JPEG", "quality": 95, "max_side": None},
+    "image-to-image":           {"format": "JPEG", "quality": 92, "max_side": 2048},
+    "image-extract":            {"format": "PNG", "compress_level": 3, "max_side": None},
+    "image-extract-v2":         {"format": "PNG", "compress_level": 3, "max_side": None},
+    "image-watermark":          {"format": "JPEG", "quality": 95, "max_side": 4096},
+    "image-shadow-v3":          {"format": "PNG", "compress_level": 3, "max_side": None},
+    "upscale2stamp":            {"format": "PNG", "compress_level": 3, "max_side": None},
+    "image-outpaint":           {"format": "JPEG", "quality": 95, "max_side": None},
+}
+
+# 未在上表中配置的模型使用的策略
+DEFAULT_UPLOAD_POLICY = {"format": "PNG", "compress_level": 6, "max_side": None}
+
+# ====================== 分块处理 ======================
+
+# 支持分块模式（节点的 tiling 选项）的模型：大图切成相互重叠的分块并发提交，结果在重叠区域羽化融合
+#   tile:    分块边长（输入像素）
+#   overlap: 相邻分块的重叠宽度（输入像素），越大接缝越不明显，但重复处理的像素越多
+TILE_POLICIES = {
+    "upscale2stamp":   {"tile": 1024, "overlap": 64},
+    "image-watermark": {"tile": 2048, "overlap": 128},
+}
+
+# ====================== 输出模式 ======================
+
+# 结果带透明通道的模型：输出 RGB IMAGE，并另外输出一个 alpha MASK（与 ComfyUI 的 MASK 一致，透明为 1）
+# 其余模型的结果按不透明处理，只输出 RGB IMAGE
+ALPHA_OUTPUT_MODELS = (
+    "background-removal",
+    "stamp-background-removal",
+    "image-extract",
+    "image-extract-v2",
+    "image-shadow-v3",
+)
+
 # ====================== 错误码映射 ======================
 
 CODE_DICT = {
@@ -0,0 +1,537 @@
+"""
+Koukoutu ComfyUI Nodes — 异步任务引擎
+在独立线程中运行一个 asyncio 事件循环：所有节点、所有并发 prompt 创建的 task_id
+都登记到同一个轮询协程，由它统一查询并通过 future 通知各自的等待方，
+大量在途任务因此只占用一个线程等待
+"""
+
+import math
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
+
+from .config import (
+        ASYNC_CREATE_URL,
+        ASYNC_QUERY_URL,
+        ASYNC_CANCEL_URL,
+        ASYNC_AUTH_HEADER,
+        MAX_RETRY_COUNT,
+        DEFAULT_MAX_WAIT,
+        CREATE_REQUEST_TIMEOUT,
+        QUERY_REQUEST_TIMEOUT,
+        DOWNLOAD_REQUEST_TIMEOUT,
+        ENGINE_IO_WORKERS,
+        INTERRUPT_CHECK_INTERVAL,
+        DOWNLOAD_CHUNK_SIZE,
+        CANCEL_REMOTE_TASKS,
+    )
+from .client import http_post, http_get
+from .errors import KoukoutuApiError, KoukoutuTaskError
+from .metrics import (
+        observe_phase,
+        timed,
+        count_poll,
+        count_retry,
+        count_error,
+        CREATE,
+        QUEUE_WAIT,
+        POLL,
+        DOWNLOAD,
+        DECODE,
+    )
+from .ratelimit import get_rate_limiter, check_rate_limited, ASYNC_CREATE, QUERY
+from .keypool import call_with_key_async
+from .retry import is_transient, retry_delay, final_error, call_with_retry_async
+from .scheduler import get_scheduler, history_key
+from .interrupt import is_interrupted, raise_if_interrupted
+from .utils import decode_image, is_image_data, code_dict
+
+
+def _headers(api_key):
+    return {
+        ASYNC_AUTH_HEADER: api_key
+    }
+
+
+def _read_result(url, abort):
+    """
+    Stream a result file, giving up between two chunks once abort is set
+
+    Returns:
+        tuple: (HTTP status, content), content is None if aborted or not 200
+    """
+    with http_get(url, stream=True, timeout=DOWNLOAD_REQUEST_TIMEOUT) as response:
+        if response.status_code != 200:
+            return response.status_code, None
+        chunks = []
+        for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+            if abort.is_set():
+                # 关闭未读完的响应即断开连接，不再接收剩余数据
+                return response.status_code, None
+            chunks.append(chunk)
+        return response.status_code, b"".join(chunks)
+
+
+class _PendingTask:
+    """
+    A created task waiting for the poller to observe its final state
+    """
+
+    __slots__ = ("task_id", "api_key", "model_key", "history_key", "future",
+                 "created", "deadline", "next_poll", "delay", "errors", "on_progress", "resumed")
+
+    def __init__(self, task_id, api_key, data, future, created, on_progress, resumed=False):
+        self.task_id = task_id
+        self.api_key = api_key
+        self.model_key = data['model_key']
+        self.history_key = history_key(data)
+        self.future = future
+        self.created = created
+        self.deadline = created + DEFAULT_MAX_WAIT
+        self.next_poll = created
+        self.delay = 0.0
+        self.errors = 0
+        self.on_progress = on_progress
+        # 从任务日志恢复的任务，created 是恢复的时刻而不是任务的创建时刻
+        self.resumed = resumed
+
+
+class TaskEngine:
+    """
+    Event-loop based engine for the Koukoutu async API
+
+    Blocking HTTP calls go through the shared pooled session on a small
+    I/O thread pool; waiting between polls costs no thread at all.
+
+    Coroutines started with run() are cancelled as soon as the ComfyUI prompt
+    is interrupted, which wakes every wait between polls at once and aborts
+    in-flight downloads.
+    """
+
+    def __init__(self, io_workers=ENGINE_IO_WORKERS):
+        self._loop = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._io = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="koukoutu-io")
+        self._pending = set()
+        self._wakeup = None
+        self._poller = None
+        # run() 启动、需要随 prompt 中断而取消的顶层协程
+        self._guarded = set()
+        self._watcher = None
+        # 取消服务端任务等不属于任何调用方的后台协程
+        self._background = set()
+
+    # ---- 事件循环管理 ----
+
+    def _ensure_started(self):
+        if self._loop is not None:
+            return self._loop
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+
+                def run():
+                    asyncio.set_event_loop(loop)
+                    loop.call_soon(ready.set)
+                    loop.run_forever()
+
+                self._thread = threading.Thread(target=run, name="koukoutu-engine", daemon=True)
+                self._thread.start()
+                ready.wait()
+                self._loop = loop
+        return self._loop
+
+    def submit(self, coro):
+        """
+        Schedule a coroutine on the engine loop from any thread
+
+        Returns:
+            concurrent.futures.Future
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_started())
+
+    def run(self, coro, on_wait=None):
+        """
+        Run a coroutine on the engine loop and block until it finishes
+
+        Args:
+            coro: coroutine to run
+            on_wait: optional callable run on the calling thread every
+                     INTERRUPT_CHECK_INTERVAL while waiting, e.g. to push
+                     progress recorded on the engine loop to a ComfyUI
+                     progress bar; if it raises, the coroutine is cancelled
+
+        Raises:
+            InterruptProcessingException: If the ComfyUI prompt was interrupted
+        """
+        future = self.submit(self._interruptible(coro))
+        if on_wait is None:
+            return future.result()
+        try:
+            while not wait_futures([future], INTERRUPT_CHECK_INTERVAL).done:
+                on_wait()
+        except BaseException:
+            future.cancel()
+            raise
+        return future.result()
+
+    async def _interruptible(self, coro):
+        task = asyncio.current_task()
+        self._guarded.add(task)
+        if self._watcher is None or self._watcher.done():
+            self._watcher = asyncio.get_running_loop().create_task(self._watch_interrupt())
+        try:
+            return await coro
+        except asyncio.CancelledError:
+            # 因中断而取消时改为抛出 ComfyUI 的中断异常，节点据此停止而不是报错
+            raise_if_interrupted()
+            raise
+        finally:
+            self._guarded.discard(task)
+
+    async def _watch_interrupt(self):
+        """
+        Cancel every guarded coroutine once the prompt is interrupted
+
+        ComfyUI only exposes the interrupt as a flag, so it is checked every
+        INTERRUPT_CHECK_INTERVAL while any run() is in progress.
+        """
+        while self._guarded:
+            if is_interrupted():
+                print(f"[Koukoutu] prompt 已取消，停止 {len(self._guarded)} 个进行中的请求")
+                tasks = list(self._guarded)
+                self._guarded.clear()
+                for task in tasks:
+                    task.cancel()
+            await asyncio.sleep(INTERRUPT_CHECK_INTERVAL)
+
+    def _spawn_background(self, coro):
+        task = asyncio.get_running_loop().create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def run_blocking(self, func, *args, **kwargs):
+        """
+        Run a blocking callable on the engine I/O pool
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._io, functools.partial(func, *args, **kwargs))
+
+    # ---- 单个阶段 ----
+
+    async def create(self, api_key, data, upload):
+        """
+        Create an async task
+
+        Args:
+            api_key: validated API key
+            data: form fields, including model_key
+            upload: (filename, bytes, mime type) sent as image_file
+
+        Returns:
+            task_id
+        """
+        await get_rate_limiter().acquire_async(api_key, ASYNC_CREATE)
+        with timed(CREATE, data['model_key']):
+            response = await self.run_blocking(
+                http_post,
+                ASYNC_CREATE_URL,
+                headers=_headers(api_key),
+                data=data,
+                files={'image_file': upload},
+                timeout=CREATE_REQUEST_TIMEOUT
+            )
+        check_rate_limited(response, api_key, ASYNC_CREATE)
+        json_response = response.json()
+        code = json_response.get('code', 0)
+        if code != 200:
+            check_rate_limited(response, api_key, ASYNC_CREATE, code)
+            raise KoukoutuApiError(
+                code_dict.get(code, f"创建任务失败: {json_response.get('message', '未知错误')}"),
+                code
+            )
+
+        task_id = json_response.get('data', {}).get('task_id')
+        if not task_id:
+            raise KoukoutuApiError(f"API 返回中未找到 task_id: {json_response}")
+        return task_id
+
+    async def wait(self, api_key, task_id, data, on_progress=None, on_cancel=None, resumed=False):
+        """
+        Wait until the shared poller sees the task finish
+
+        The first query is scheduled from the completion-time history of
+        the model (see scheduler.py) rather than after a fixed interval.
+        on_progress is called on the engine loop and should only record the
+        value: the loop thread has no ComfyUI executing-node context.
+        Set resumed for a task created before a restart: its completion time
+        is unknown, so it is not added to the history.
+
+        If the wait is cancelled because the prompt was interrupted and
+        CANCEL_REMOTE_TASKS is set, the task is cancelled on the server in the
+        background and on_cancel() is called on the I/O pool once it is.
+
+        Returns:
+            str: result_file URL
+
+        Raises:
+            KoukoutuTaskError: If the task finished with state=2
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        task = _PendingTask(task_id, api_key, data, future, loop.time(), on_progress, resumed)
+        task.delay = get_scheduler().first_delay(task.history_key)
+        task.next_poll = task.created + task.delay
+        self._pending.add(task)
+        self._wake()
+        try:
+            with timed(QUEUE_WAIT, task.model_key):
+                return await future
+        except asyncio.CancelledError:
+            if CANCEL_REMOTE_TASKS and is_interrupted():
+                self._spawn_background(self._cancel_remote(task, on_cancel))
+            raise
+        finally:
+            self._pending.discard(task)
+
+    async def _cancel_remote(self, task, on_cancel):
+        """
+        Best-effort cancel of a task nobody waits for any more
+        """
+        try:
+            response = await self.run_blocking(
+                http_post,
+                ASYNC_CANCEL_URL,
+                headers=_headers(task.api_key),
+                data={
+                    'task_id': str(task.task_id),
+                    'model_key': task.model_key,
+                },
+                timeout=QUERY_REQUEST_TIMEOUT
+            )
+            code = response.json().get('code', 0)
+            if code != 200:
+                raise KoukoutuApiError(code_dict.get(code, f"取消任务失败，HTTP {response.status_code}"), code)
+        except Exception as e:
+            # 取消失败时任务继续在服务端运行，任务日志保留，重新执行时照常恢复
+            print(f"[Koukoutu] 取消任务 {task.task_id} 失败: {e}")
+            return
+        print(f"[Koukoutu] 已取消任务 {task.task_id}")
+        if on_cancel is not None:
+            await self.run_blocking(on_cancel)
+
+    async def download(self, url, model_key, decode=True):
+        """
+        Download a result file and decode it on the I/O pool
+
+        Decoding right after the download overlaps it with the network
+        phases of the other tasks instead of running serially at the end.
+        The file is streamed in DOWNLOAD_CHUNK_SIZE chunks, so a cancelled
+        download stops reading and drops the connection.
+
+        Returns:
+            tuple: (raw bytes, decoded PIL Image, or None if decode is off)
+        """
+        abort = threading.Event()
+        try:
+            with timed(DOWNLOAD, model_key):
+                status, content = await self.run_blocking(_read_result, url, abort)
+        except asyncio.CancelledError:
+            abort.set()
+            raise
+        if status != 200:
+            raise KoukoutuApiError(f"下载结果图像失败，HTTP {status}", status)
+        if not is_image_data(content):
+            raise KoukoutuApiError("下载的结果不是可识别的图像")
+        if not decode:
+            return content, None
+        with timed(DECODE, model_key):
+            image = await self.run_blocking(decode_image, content)
+        return content, image
+
+    async def submit_task(self, api_key, data, upload):
+        """
+        Create a task, retrying transient failures
+
+        With the key pool, a key rejected as invalid or out of credits is
+        retired and the task is created with the next key.
+
+        Returns:
+            tuple: (task_id, key the task was created with, used to query it)
+        """
+        return await call_with_key_async(api_key, ASYNC_CREATE, lambda key: call_with_retry_async(
+            lambda: self.create(key, data, upload), "创建任务", CREATE, data['model_key']
+        ))
+
+    async def fetch_result(self, url, model_key, decode=True):
+        """
+        Download and decode a result file, retrying transient failures
+
+        Returns:
+            tuple: (raw bytes, decoded PIL Image, or None if decode is off)
+        """
+        return await call_with_retry_async(
+            lambda: self.download(url, model_key, decode), "下载结果", DOWNLOAD, model_key
+        )
+
+    # ---- 统一轮询 ----
+
+    def _wake(self):
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        self._wakeup.set()
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.get_running_loop().create_task(self._poll_loop())
+
+    async def _poll_loop(self):
+        """
+        Dispatch every due query as its own coroutine
+
+        A slow query (or a rate limiter wait) only delays its own task: the
+        loop never waits for a query, it sleeps until the next task is due or
+        until a finished query reschedules its task and wakes it up.
+        """
+        loop = asyncio.get_running_loop()
+        while self._pending:
+            self._wakeup.clear()
+            now = loop.time()
+            for task in [task for task in self._pending if task.next_poll <= now]:
+                # 查询进行中不再重复调度，查询结束后由 _poll_task 安排下一次查询
+                task.next_poll = math.inf
+                self._spawn_background(self._poll_task(task))
+            if not self._pending:
+                break
+            delay = min(task.next_poll for task in self._pending) - loop.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), None if math.isinf(delay) else delay)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _poll_task(self, task):
+        try:
+            await self._poll_one(task)
+        except Exception as e:
+            # 意外错误（例如进度回调抛出）只结束这一个任务，共享的轮询协程继续运行
+            count_error(task.model_key, e)
+            self._finish(task, error=e)
+        if task in self._pending:
+            self._wake()
+
+    async def _poll_one(self, task):
+        if task.future.done():
+            self._pending.discard(task)
+            return
+        try:
+            await get_rate_limiter().acquire_async(task.api_key, QUERY)
+            count_poll(task.model_key)
+            started = asyncio.get_running_loop().time()
+            query_response = await self.run_blocking(
+                http_post,
+                ASYNC_QUERY_URL,
+                headers=_headers(task.api_key),
+                data={
+                    'task_id': str(task.task_id),
+                    'response': 'url',
+                    'model_key': task.model_key,
+                },
+                timeout=QUERY_REQUEST_TIMEOUT
+            )
+            observe_phase(POLL, task.model_key, asyncio.get_running_loop().time() - started)
+            check_rate_limited(query_response, task.api_key, QUERY)
+            query_json = query_response.json()
+            query_code = query_json.get('code', 0)
+            if query_code != 200:
+                check_rate_limited(query_response, task.api_key, QUERY, query_code)
+                raise KoukoutuApiError(
+                    code_dict.get(query_code, f"查询任务失败: {query_json.get('message', '未知错误')}"),
+                    query_code
+                )
+        except Exception as e:
+            self._query_failed(task, e)
+            return
+        task.errors = 0
+
+        query_data = query_json.get('data', {})
+        state = query_data.get('state', 0)
+        result_file = query_data.get('result_file')
+        msg = query_data.get('message', '')
+
+        now = asyncio.get_running_loop().time()
+        if state == 1 and result_file:
+            if not task.resumed:
+                # 写入历史文件在 I/O 线程池中进行，不阻塞共享的事件循环
+                self._spawn_background(
+                    self.run_blocking(get_scheduler().record, task.history_key, now - task.created)
+                )
+            self._finish(task, result=result_file)
+            return
+
+        if state == 2:
+            error_msg = msg if msg else "任务处理失败，未知错误"
+            print(f"[Koukoutu] 任务 {task.task_id} 出错: {error_msg}")
+            error = KoukoutuTaskError(error_msg)
+            count_error(task.model_key, error)
+            self._finish(task, error=error)
+            return
+
+        # state == 0: 任务仍在运行，安排下一次查询
+        progress = query_data.get('progress', '0')
+        try:
+            progress_val = int(float(progress))
+        except (ValueError, TypeError):
+            progress_val = 0
+        if task.on_progress is not None:
+            task.on_progress(progress_val)
+        print(f"[Koukoutu] 任务 {task.task_id} 运行中… 进度: {progress}%")
+
+        if now >= task.deadline:
+            error = TimeoutError(f"任务超时（等待超过 {DEFAULT_MAX_WAIT} 秒），task_id: {task.task_id}")
+            count_error(task.model_key, error)
+            self._finish(task, error=error)
+            return
+        task.delay = get_scheduler().next_delay(
+            task.history_key, now - task.created, progress_val, task.delay
+        )
+        task.next_poll = min(now + task.delay, task.deadline)
+
+    def _query_failed(self, task, error):
+        count_error(task.model_key, error)
+        if not is_transient(error) or task.errors >= MAX_RETRY_COUNT:
+            self._finish(task, error=final_error(error))
+            return
+        # 查询失败不影响已创建的任务，稍后针对同一个 task_id 重新查询
+        task.errors += 1
+        count_retry(POLL, task.model_key)
+        delay = retry_delay(error, task.errors)
+        print(f"[Koukoutu] 查询任务 {task.task_id} 失败，{delay:.1f} 秒后第 {task.errors} 次重试: {error}")
+        now = asyncio.get_running_loop().time()
+        task.next_poll = min(now + delay, task.deadline)
+
+    def _finish(self, task, result=None, error=None):
+        self._pending.discard(task)
+        if task.future.done():
+            return
+        if error is not None:
+            task.future.set_exception(error)
+        else:
+            task.future.set_result(result)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """
+    Return the process-wide task engine, creating it on first use
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = TaskEngine()
+    return _engine
@@ -0,0 +1,26 @@
+"""
+Koukoutu ComfyUI Nodes — 异常类型
+"""
+
+from .config import RETRY_STATUS_CODES, RATE_LIMITED_CODE
+
+
+class KoukoutuApiError(Exception):
+    """
+    API 返回了非 200 的业务状态码
+    """
+
+    def __init__(self, message, code=None, retry_after=None):
+        super().__init__(message)
+        self.code = code
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self):
+        return self.code in RETRY_STATUS_CODES or self.code == RATE_LIMITED_CODE
+
+
+class KoukoutuTaskError(Exception):
+    """
+    异步任务在服务端处理失败（state=2），节点可按 skip_error 决定是否回退原图
+    """
@@ -0,0 +1,284 @@
+"""
+Koukoutu ComfyUI Nodes — 文件夹批处理
+把输入目录中的图像逐个流式送入任意模型，结果的原始字节直接写入输出目录；
+同一时刻只处理 FOLDER_MAX_WORKERS 张图像，不构造整批的浮点张量，
+内存占用与图像总数无关
+"""
+
+import io
+import os
+import asyncio
+import functools
+
+from PIL import Image
+
+from .config import (
+        SYNC_MODELS,
+        KEY_RETIRE_CODES,
+        FOLDER_MAX_WORKERS,
+        FOLDER_IMAGE_EXTENSIONS,
+        FOLDER_ERROR_SAMPLES,
+    )
+from .api import prepare_upload, fetch_sync
+from .journal import record_created, record_finished, record_discarded
+from .singleflight import share_async
+from .cache import cache_put
+from .engine import get_engine
+from .handle import ResultItem
+from .errors import KoukoutuApiError, KoukoutuTaskError
+
+
+# 结果格式 -> 输出文件扩展名
+_RESULT_EXTENSIONS = {"PNG": ".png", "JPEG": ".jpg", "WEBP": ".webp"}
+
+
+def list_images(input_dir):
+    """
+    Names of the image files directly inside input_dir, sorted
+
+    Returns:
+        list: file names (not paths)
+    """
+    return sorted(
+        entry.name for entry in os.scandir(input_dir)
+        if entry.is_file() and entry.name.lower().endswith(FOLDER_IMAGE_EXTENSIONS)
+    )
+
+
+def _output_paths(output_dir, name):
+    # 输出名保留输入扩展名（a.jpg -> a.jpg.png），a.jpg 与 a.png 的结果因此不会落到同一个文件
+    return [os.path.join(output_dir, name + ext) for ext in sorted(set(_RESULT_EXTENSIONS.values()))]
+
+
+def _result_extension(content):
+    try:
+        with Image.open(io.BytesIO(content)) as header:
+            return _RESULT_EXTENSIONS.get(header.format, ".png")
+    except OSError:
+        return ".png"
+
+
+def _load(path, data, api_key=None):
+    """
+    Read one input file and look it up in the result cache and, when api_key
+    is given, in the job journal
+
+    The file bytes are forwarded to the API as they are when they fit the
+    upload policy (see upload.reuse_encoded), so most files are never decoded.
+
+    Returns:
+        tuple: (file digest, cache key, upload or None, cached result or None,
+                journal entry to resume or None)
+    """
+    with open(path, "rb") as f:
+        source = ResultItem(f.read())
+    return (source.digest,) + prepare_upload(source, source.digest, data, api_key)
+
+
+def _write(output_dir, name, content):
+    """
+    Write a result next to the other outputs, named after the input file
+    (input name plus the extension of the result format, e.g. a.jpg.png)
+
+    The bytes go to a temporary file first, so an interrupted job never
+    leaves a truncated image behind.
+    """
+    path = os.path.join(output_dir, name + _result_extension(content))
+    temp_path = path + ".part"
+    with open(temp_path, "wb") as f:
+        f.write(content)
+    os.replace(temp_path, path)
+    return path
+
+
+def _skippable(error):
+    """
+    Per-file errors that skip_error turns into a failed entry
+
+    Invalid keys and exhausted credits would fail every remaining file, so
+    they always abort the job.
+    """
+    if isinstance(error, KoukoutuApiError):
+        return error.code not in KEY_RETIRE_CODES
+    return isinstance(error, (KoukoutuTaskError, OSError))
+
+
+class _FolderJob:
+    """
+    Worker coroutines pulling file names from one shared iterator
+
+    Every worker carries a single file through read, upload, wait, download
+    and write before taking the next one, so at most FOLDER_MAX_WORKERS
+    files are held in memory at once. Async tasks go through the job journal,
+    so a job restarted after a crash resumes the tasks it had created.
+    """
+
+    def __init__(self, engine, api_key, data, input_dir, output_dir, names,
+                 skip_error, overwrite, on_progress):
+        self.engine = engine
+        self.api_key = api_key
+        self.data = data
+        self.model_key = data['model_key']
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.total = len(names)
+        self.skip_error = skip_error
+        self.overwrite = overwrite
+        self.on_progress = on_progress
+        self.succeeded = 0
+        self.skipped = 0
+        self.failed = 0
+        self.errors = []
+        self._names = iter(names)
+        self._reported = 0
+
+    async def run(self, max_workers):
+        tasks = [asyncio.ensure_future(self._worker()) for _ in range(max(1, min(max_workers, self.total)))]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _worker(self):
+        for name in self._names:
+            try:
+                await self._process(name)
+            except Exception as e:
+                if not self.skip_error or not _skippable(e):
+                    raise
+                self.failed += 1
+                if len(self.errors) < FOLDER_ERROR_SAMPLES:
+                    self.errors.append(f"{name}: {e}")
+                print(f"[Koukoutu] 文件 {name} 处理失败: {e}")
+
+    def report_progress(self):
+        """
+        Pass the number of finished files to on_progress if it changed
+
+        Called on the thread that runs the job (see TaskEngine.run's on_wait),
+        never on the engine loop, so on_progress may update a ComfyUI
+        progress bar.
+        """
+        done = self.succeeded + self.skipped + self.failed
+        if done != self._reported:
+            self._reported = done
+            self.on_progress(done, self.total)
+
+    async def _process(self, name):
+        if not self.overwrite and any(os.path.exists(p) for p in _output_paths(self.output_dir, name)):
+            self.skipped += 1
+            return
+        path = os.path.join(self.input_dir, name)
+        api_key = None if self.model_key in SYNC_MODELS else self.api_key
+        digest, key, upload, content, resume = await self.engine.run_blocking(_load, path, self.data, api_key)
+        if content is None and resume is not None:
+            content = await self._resume(key, resume)
+            if content is None:
+                # 无法恢复时重新读取文件并提交
+                digest, key, upload, content, _ = await self.engine.run_blocking(_load, path, self.data)
+        if content is None:
+            content = await self._fetch(digest, key, upload)
+        await self.engine.run_blocking(_write, self.output_dir, name, content)
+        self.succeeded += 1
+
+    async def _fetch(self, digest, key, upload):
+        if self.model_key in SYNC_MODELS:
+            content, _ = await self.engine.run_blocking(
+                fetch_sync, self.api_key, self.data, upload, key, False
+            )
+            return content
+        # 其他文件或 prompt 正在请求相同内容时共享其结果
+        return await share_async(key, lambda: self._submit(digest, key, upload))
+
+    async def _submit(self, digest, key, upload):
+        task_id, api_key = await self.engine.submit_task(self.api_key, self.data, upload)
+        await self.engine.run_blocking(record_created, key, digest, self.data, task_id, api_key)
+        return await self._finish(key, task_id, api_key)
+
+    async def _finish(self, key, task_id, api_key, result_file=None, resumed=False):
+        if result_file is None:
+            try:
+                result_file = await self.engine.wait(
+                    api_key, task_id, self.data, on_cancel=functools.partial(record_discarded, key),
+                    resumed=resumed
+                )
+            except KoukoutuTaskError:
+                await self.engine.run_blocking(record_discarded, key)
+                raise
+            await self.engine.run_blocking(record_finished, key, result_file)
+        content, _ = await self.engine.fetch_result(result_file, self.model_key, False)
+        await self.engine.run_blocking(cache_put, key, content)
+        return content
+
+    async def _resume(self, key, resume):
+        """
+        Finish a task journaled before a restart
+
+        Returns:
+            bytes: the result, or None if the task has to be submitted again
+        """
+        task_id, api_key, result_file = resume
+        try:
+            return await self._finish(key, task_id, api_key, result_file, resumed=True)
+        except KoukoutuApiError as e:
+            print(f"[Koukoutu] 无法恢复任务 {task_id}，重新提交: {e}")
+            await self.engine.run_blocking(record_discarded, key)
+            return None
+
+
+def run_folder(input_dir, output_dir, api_key, data, skip_error=True, overwrite=False,
+               on_progress=None, max_workers=FOLDER_MAX_WORKERS):
+    """
+    Process every image of a directory with one model and write the results
+
+    Args:
+        input_dir: directory with the input images (not recursive)
+        output_dir: directory the results are written to, created if needed
+        api_key: validated API key
+        data: form fields, including model_key
+        skip_error: record failed files and go on instead of raising
+        overwrite: process files whose result already exists in output_dir
+        on_progress: optional callback receiving (finished files, total files),
+                     called on the calling thread
+        max_workers: number of files processed at once
+
+    Returns:
+        dict: total / succeeded / skipped / failed counts and sample errors
+    """
+    if not os.path.isdir(input_dir):
+        raise ValueError(f"输入目录不存在: {input_dir}")
+    os.makedirs(output_dir, exist_ok=True)
+    if data['model_key'] in SYNC_MODELS:
+        # 同步接口需要 response=file 才直接返回图像字节
+        data = dict(data, response=data.get('response', 'file'))
+    engine = get_engine()
+    job = _FolderJob(
+        engine, api_key, data, input_dir, output_dir, list_images(input_dir),
+        skip_error, overwrite, on_progress
+    )
+    if job.total:
+        engine.run(job.run(max_workers), on_wait=job.report_progress if on_progress else None)
+        if on_progress is not None:
+            job.report_progress()
+    return {
+        "total": job.total,
+        "succeeded": job.succeeded,
+        "skipped": job.skipped,
+        "failed": job.failed,
+        "errors": job.errors,
+    }
+
+
+def format_summary(summary):
+    """
+    Human-readable summary of run_folder's result
+    """
+    lines = [
+        f"共 {summary['total']} 个文件：成功 {summary['succeeded']}，"
+        f"已存在跳过 {summary['skipped']}，失败 {summary['failed']}"
+    ]
+    lines.extend(summary["errors"])
+    if summary["failed"] > len(summary["errors"]):
+        lines.append(f"……其余 {summary['failed'] - len(summary['errors'])} 个失败文件见控制台日志")
+    return "\n".join(lines)
@@ -0,0 +1,72 @@
+"""
+Koukoutu ComfyUI Nodes — KOUKOUTU_RESULT 结果句柄
+节点额外输出一个惰性句柄，保存 API 返回的原始编码字节与 result_file 地址；
+串联的 Koukoutu 节点直接转发原始字节上传，不经过解码、浮点转换和重新编码
+"""
+
+import hashlib
+
+from .utils import batch_fingerprints, tensor_fingerprint
+
+
+RESULT_TYPE = "KOUKOUTU_RESULT"
+
+
+class ResultItem:
+    """
+    Encoded result of one image, exactly as returned by the API
+    """
+
+    __slots__ = ("data", "url", "_digest")
+
+    def __init__(self, data, url=None):
+        self.data = data
+        self.url = url
+        self._digest = None
+
+    @property
+    def digest(self):
+        """
+        Digest of the encoded bytes, used as the image part of cache keys
+        """
+        if self._digest is None:
+            self._digest = "raw:" + hashlib.blake2b(self.data, digest_size=16).hexdigest()
+        return self._digest
+
+
+class KoukoutuResult:
+    """
+    Lazy handle to the results of a Koukoutu node batch
+
+    Every item is a ResultItem, or the input tensor [1, H, W, C] of an item
+    that failed and fell back to the original image.
+    """
+
+    def __init__(self, items):
+        self.items = list(items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def fingerprint(self):
+        """
+        Content digest of the whole handle (for IS_CHANGED)
+        """
+        digests = [
+            item.digest if isinstance(item, ResultItem) else batch_fingerprints(item)[0]
+            for item in self.items
+        ]
+        return hashlib.blake2b("".join(digests).encode(), digest_size=16).hexdigest()
+
+
+def input_fingerprint(image, result):
+    """
+    Digest of a node's image input: the KOUKOUTU_RESULT handle when one is
+    connected, else the IMAGE tensor
+    """
+    if result is not None:
+        return result.fingerprint()
+    if image is not None:
+        return tensor_fingerprint(image)
+    return "no_image"
+
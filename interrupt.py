@@ -0,0 +1,75 @@
+"""
+Koukoutu ComfyUI Nodes — 中断处理
+用户在 ComfyUI 中取消 prompt 时，正在轮询、重试等待或下载的 Koukoutu 请求立即停止，
+而不是继续等到任务完成或超时，执行线程得以马上处理下一个 prompt
+"""
+
+import sys
+import time
+from concurrent.futures import wait
+
+from .config import INTERRUPT_CHECK_INTERVAL
+
+
+def _model_management():
+    # 只在 ComfyUI 已加载该模块时使用，命令行工具（tools/folder_batch.py）不会因此初始化显卡
+    return sys.modules.get("comfy.model_management")
+
+
+def is_interrupted():
+    """
+    Returns:
+        bool: True if the user interrupted the current ComfyUI prompt
+    """
+    model_management = _model_management()
+    return model_management is not None and model_management.processing_interrupted()
+
+
+def raise_if_interrupted():
+    """
+    Raise ComfyUI's InterruptProcessingException if the prompt was interrupted
+
+    Unlike comfy.model_management.throw_exception_if_processing_interrupted,
+    the flag is left set, so every other Koukoutu node of the prompt that is
+    waiting concurrently stops as well; ComfyUI clears it for the next prompt.
+    """
+    if is_interrupted():
+        raise _model_management().InterruptProcessingException()
+
+
+def is_interrupt(error):
+    """
+    Returns:
+        bool: True if error is ComfyUI's InterruptProcessingException, which
+              nodes must re-raise unchanged
+    """
+    model_management = _model_management()
+    return model_management is not None and isinstance(error, model_management.InterruptProcessingException)
+
+
+def interruptible_sleep(seconds):
+    """
+    time.sleep that wakes every INTERRUPT_CHECK_INTERVAL to check for an interrupt
+
+    Raises:
+        InterruptProcessingException: If the prompt was interrupted meanwhile
+    """
+    deadline = time.monotonic() + seconds
+    while True:
+        raise_if_interrupted()
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        time.sleep(min(remaining, INTERRUPT_CHECK_INTERVAL))
+
+
+def interruptible_result(future):
+    """
+    Block on a concurrent Future, giving up as soon as the prompt is interrupted
+
+    Raises:
+        InterruptProcessingException: If the prompt was interrupted meanwhile
+    """
+    while not wait([future], INTERRUPT_CHECK_INTERVAL).done:
+        raise_if_interrupted()
+    return future.result()
@@ -0,0 +1,154 @@
+"""
+Koukoutu ComfyUI Nodes — 任务日志
+把每个已创建的异步任务持久化到本地 SQLite：输入摘要、model_key、参数、task_id、状态与结果地址。
+ComfyUI 重启后重新执行同一批次时，未完成的任务继续轮询，已完成的任务直接下载结果，
+不会重新提交和重复计费
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+
+from .config import (
+        JOB_JOURNAL_ENABLED,
+        JOB_JOURNAL_FILE,
+        JOB_JOURNAL_MAX_AGE,
+    )
+from .keypool import key_id, find_key
+
+
+# 任务状态
+RUNNING = "running"
+FINISHED = "finished"
+
+
+class JobJournal:
+    """
+    SQLite table of async tasks keyed by the result cache key of the request
+
+    A row is written as soon as a task is created and updated with the
+    result_file URL when it finishes. Failed tasks are removed so they are
+    submitted again. Keys are stored as key_id digests, never in clear.
+    """
+
+    def __init__(self, path=JOB_JOURNAL_FILE, max_age=JOB_JOURNAL_MAX_AGE):
+        self._path = path
+        self._max_age = max_age
+        self._lock = threading.Lock()
+        self._db = None
+
+    def _connect(self):
+        if self._db is None:
+            os.makedirs(os.path.dirname(self._path), exist_ok=True)
+            db = sqlite3.connect(self._path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " key TEXT PRIMARY KEY, digest TEXT, model_key TEXT, params TEXT,"
+                " task_id TEXT, key_id TEXT, state TEXT, result_file TEXT, updated REAL)"
+            )
+            db.execute("DELETE FROM jobs WHERE updated < ?", (time.time() - self._max_age,))
+            db.commit()
+            self._db = db
+        return self._db
+
+    def _execute(self, sql, args):
+        with self._lock:
+            try:
+                db = self._connect()
+                rows = db.execute(sql, args).fetchall()
+                db.commit()
+                return rows
+            except sqlite3.Error as e:
+                print(f"[Koukoutu] 访问任务日志失败: {e}")
+                return []
+
+    def get(self, key):
+        """
+        Returns:
+            tuple: (task_id, key_id, state, result_file), or None
+        """
+        rows = self._execute(
+            "SELECT task_id, key_id, state, result_file FROM jobs WHERE key = ? AND updated >= ?",
+            (key, time.time() - self._max_age),
+        )
+        return rows[0] if rows else None
+
+    def created(self, key, digest, data, task_id, api_key):
+        params = json.dumps({str(k): str(v) for k, v in data.items()}, sort_keys=True, ensure_ascii=False)
+        self._execute(
+            "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, NULL, ?)",
+            (key, digest, data['model_key'], params, task_id, key_id(api_key), RUNNING, time.time()),
+        )
+
+    def finished(self, key, result_file):
+        self._execute(
+            "UPDATE jobs SET state = ?, result_file = ?, updated = ? WHERE key = ?",
+            (FINISHED, result_file, time.time(), key),
+        )
+
+    def discard(self, key):
+        self._execute("DELETE FROM jobs WHERE key = ?", (key,))
+
+
+_journal = None
+_journal_lock = threading.Lock()
+
+
+def get_job_journal():
+    """
+    Return the process-wide job journal, or None if it is disabled
+    """
+    global _journal
+    if not JOB_JOURNAL_ENABLED:
+        return None
+    if _journal is None:
+        with _journal_lock:
+            if _journal is None:
+                _journal = JobJournal()
+    return _journal
+
+
+def resume_task(key, api_key):
+    """
+    Look up a task created for this request before a restart
+
+    Args:
+        key: result cache key of the request
+        api_key: validated API key of the node (or the pool marker)
+
+    Returns:
+        tuple: (task_id, key to query it with, result_file or None), or None
+               when there is nothing to resume
+    """
+    journal = get_job_journal()
+    entry = journal.get(key) if journal is not None else None
+    if entry is None:
+        return None
+    task_id, wanted_id, state, result_file = entry
+    query_key = find_key(api_key, wanted_id)
+    if query_key is None:
+        # 创建任务的 Key 已不可用，无法再查询该任务
+        return None
+    return task_id, query_key, result_file if state == FINISHED else None
+
+
+def record_created(key, digest, data, task_id, api_key):
+    journal = get_job_journal()
+    if journal is not None:
+        journal.created(key, digest, data, task_id, api_key)
+
+
+def record_finished(key, result_file):
+    journal = get_job_journal()
+    if journal is not None:
+        journal.finished(key, result_file)
+
+
+def record_discarded(key):
+    journal = get_job_journal()
+    if journal is not None:
+        journal.discard(key)
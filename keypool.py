@@ -0,0 +1,200 @@
+"""
+Koukoutu ComfyUI Nodes — API Key 池
+从环境变量或文件加载多个 API Key，每次创建任务时选择剩余速率额度最多的 Key；
+Key 返回无效、积分不足或额度不足时自动暂停并切换到下一个 Key，节点无需感知
+"""
+
+import os
+import time
+import hashlib
+import threading
+
+from .config import (
+        API_KEYS,
+        API_KEYS_FILE,
+        KEY_RETIRE_CODES,
+        KEY_RETIRE_SECONDS,
+    )
+from .errors import KoukoutuApiError
+from .ratelimit import get_rate_limiter
+
+
+# 节点 api_key 留空且配置了 Key 池时，validate_api_key 返回该标记代替具体的 Key
+POOL_API_KEY = "<koukoutu-key-pool>"
+
+
+def load_api_keys(value=API_KEYS, path=API_KEYS_FILE):
+    """
+    Read pool keys from the environment value and the key file
+
+    Returns:
+        list: keys in order, without duplicates
+    """
+    keys = value.replace(",", "\n").splitlines()
+    if path and os.path.isfile(path):
+        with open(path, encoding="utf-8") as f:
+            keys.extend(f.read().splitlines())
+
+    result = []
+    for key in keys:
+        key = key.strip()
+        if key and not key.startswith("#") and key not in result:
+            result.append(key)
+    return result
+
+
+class KeyPool:
+    """
+    Set of API keys shared by every node
+
+    choose() returns the active key with the most rate-limiter tokens left
+    on an endpoint (least recently used first on ties). Retired keys are
+    skipped until KEY_RETIRE_SECONDS have passed.
+    """
+
+    def __init__(self, keys):
+        self._keys = list(keys)
+        self._lock = threading.Lock()
+        self._retired = {}
+        self._last_used = {key: 0.0 for key in self._keys}
+
+    def __len__(self):
+        return len(self._keys)
+
+    def active_keys(self):
+        now = time.monotonic()
+        with self._lock:
+            for key, until in list(self._retired.items()):
+                if until <= now:
+                    del self._retired[key]
+                    print(f"[Koukoutu] API Key {_mask(key)} 重新启用")
+            return [key for key in self._keys if key not in self._retired]
+
+    def choose(self, endpoint, exclude=()):
+        """
+        Pick the key to send the next request to
+
+        Raises:
+            ValueError: If every key is retired or excluded
+        """
+        keys = [key for key in self.active_keys() if key not in exclude]
+        if not keys:
+            raise ValueError("Key 池中没有可用的 API Key（均已无效或积分/额度不足）")
+        limiter = get_rate_limiter()
+        with self._lock:
+            key = max(keys, key=lambda k: (limiter.bucket(k, endpoint).available(), -self._last_used[k]))
+            self._last_used[key] = time.monotonic()
+        return key
+
+    def retire(self, key, reason):
+        with self._lock:
+            self._retired[key] = time.monotonic() + KEY_RETIRE_SECONDS
+        print(f"[Koukoutu] API Key {_mask(key)} 暂停使用 {KEY_RETIRE_SECONDS} 秒: {reason}")
+
+
+def _mask(key):
+    return f"{key[:4]}…{key[-4:]}" if len(key) > 8 else "****"
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_key_pool():
+    """
+    Return the process-wide key pool, loading it on first use
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = KeyPool(load_api_keys())
+    return _pool
+
+
+def key_id(api_key):
+    """
+    Short digest identifying a key without storing it (e.g. in the job journal)
+    """
+    return hashlib.blake2b(api_key.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def find_key(api_key, wanted_id):
+    """
+    Find the key whose key_id is wanted_id: the node's own key, or one of the pool keys
+
+    Returns:
+        str: the key, or None if it is no longer configured
+    """
+    keys = get_key_pool().active_keys() if api_key == POOL_API_KEY else [api_key]
+    for key in keys:
+        if key_id(key) == wanted_id:
+            return key
+    return None
+
+
+def _next_key(pool, endpoint, tried, error):
+    try:
+        return pool.choose(endpoint, tried)
+    except ValueError:
+        # 所有 Key 都已失败时，抛出最后一个 Key 的原始错误
+        if error is not None:
+            raise error
+        raise
+
+
+def _should_failover(api_key, error):
+    return api_key == POOL_API_KEY and isinstance(error, KoukoutuApiError) and error.code in KEY_RETIRE_CODES
+
+
+def call_with_key(api_key, endpoint, func):
+    """
+    Call func(key) with the given key, or with pool keys until one succeeds
+
+    With a single key this is just func(api_key). With the pool, a key that
+    is rejected with a KEY_RETIRE_CODES error is retired and the call is
+    repeated with the next key.
+
+    Returns:
+        tuple: (result of func, key that was used)
+    """
+    if api_key != POOL_API_KEY:
+        return func(api_key), api_key
+    pool = get_key_pool()
+    tried = set()
+    error = None
+    while True:
+        key = _next_key(pool, endpoint, tried, error)
+        try:
+            return func(key), key
+        except Exception as e:
+            if not _should_failover(api_key, e):
+                raise
+            pool.retire(key, e)
+            tried.add(key)
+            error = e
+
+
+async def call_with_key_async(api_key, endpoint, func):
+    """
+    Await func(key) with the given key, or with pool keys until one succeeds
+    (see call_with_key)
+
+    Returns:
+        tuple: (result of func, key that was used)
+    """
+    if api_key != POOL_API_KEY:
+        return await func(api_key), api_key
+    pool = get_key_pool()
+    tried = set()
+    error = None
+    while True:
+        key = _next_key(pool, endpoint, tried, error)
+        try:
+            return await func(key), key
+        except Exception as e:
+            if not _should_failover(api_key, e):
+                raise
+            pool.retire(key, e)
+            tried.add(key)
+            error = e
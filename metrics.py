@@ -0,0 +1,202 @@
+"""
+Koukoutu ComfyUI Nodes — 性能指标
+按 model_key 统计各阶段耗时（直方图）以及重试、轮询、错误码计数，
+通过 ComfyUI 的 HTTP 路由以 Prometheus 文本格式输出，
+用于区分慢任务是来自 Koukoutu 后端、上行网络还是本地 CPU
+"""
+
+import time
+import threading
+from contextlib import contextmanager
+
+from .config import METRICS_ROUTE, METRICS_BUCKETS
+
+
+# 阶段名称（koukoutu_phase_seconds 的 phase 标签）
+TENSOR_TO_PIL = "tensor_to_pil"
+ENCODE = "encode"
+CREATE = "create"
+QUEUE_WAIT = "queue_wait"
+POLL = "poll"
+DOWNLOAD = "download"
+DECODE = "decode"
+PIL_TO_TENSOR = "pil_to_tensor"
+
+
+class Histogram:
+    """
+    Cumulative histogram with fixed bucket upper bounds
+    """
+
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * len(bounds)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.bounds, self.counts):
+            total += count
+            yield bound, total
+
+
+def _format_labels(labels):
+    return ",".join(
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels
+    )
+
+
+def _format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """
+    Thread-safe store of histograms and counters keyed by label values
+    """
+
+    def __init__(self, buckets=METRICS_BUCKETS):
+        self._buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._help = {}
+
+    def observe(self, name, help_text, seconds, **labels):
+        """
+        Add one observation to a histogram
+        """
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._help.setdefault(name, help_text)
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(self._buckets)
+            histogram.observe(seconds)
+
+    def inc(self, name, help_text, amount=1, **labels):
+        """
+        Increase a counter
+        """
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._help.setdefault(name, help_text)
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def render(self):
+        """
+        Render all metrics in the Prometheus text exposition format
+
+        Returns:
+            str
+        """
+        lines = []
+        with self._lock:
+            for name in sorted(self._histograms):
+                lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in sorted(self._histograms[name].items()):
+                    for bound, count in histogram.cumulative():
+                        labels = _format_labels(key + (("le", _format_number(float(bound))),))
+                        lines.append(f"{name}_bucket{{{labels}}} {count}")
+                    labels = _format_labels(key + (("le", "+Inf"),))
+                    lines.append(f"{name}_bucket{{{labels}}} {histogram.count}")
+                    labels = _format_labels(key)
+                    lines.append(f"{name}_sum{{{labels}}} {_format_number(histogram.sum)}")
+                    lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+            for name in sorted(self._counters):
+                lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(self._counters[name].items()):
+                    lines.append(f"{name}{{{_format_labels(key)}}} {_format_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+_registry = MetricsRegistry()
+
+
+def get_metrics():
+    """
+    Return the process-wide metrics registry
+    """
+    return _registry
+
+
+def observe_phase(phase, model_key, seconds):
+    """
+    Record the duration of one phase of a request
+    """
+    _registry.observe(
+        "koukoutu_phase_seconds", "Duration of each phase of a Koukoutu request",
+        seconds, phase=phase, model_key=model_key
+    )
+
+
+@contextmanager
+def timed(phase, model_key):
+    """
+    Context manager recording the wall time of its body as a phase
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_phase(phase, model_key, time.perf_counter() - start)
+
+
+def count_retry(phase, model_key):
+    _registry.inc(
+        "koukoutu_retries_total", "Retries of a request phase after a transient error",
+        phase=phase, model_key=model_key
+    )
+
+
+def count_poll(model_key):
+    _registry.inc("koukoutu_polls_total", "Task status queries sent", model_key=model_key)
+
+
+def count_error(model_key, error):
+    """
+    Count an error by its API code (or its kind when it has none)
+    """
+    code = getattr(error, "code", None)
+    if code is None:
+        code = type(error).__name__
+    _registry.inc(
+        "koukoutu_errors_total", "Errors seen, by API code or exception type",
+        model_key=model_key, code=code
+    )
+
+
+def register_routes():
+    """
+    Expose the metrics at METRICS_ROUTE on the ComfyUI server
+    """
+    from aiohttp import web
+    from server import PromptServer
+
+    @PromptServer.instance.routes.get(METRICS_ROUTE)
+    async def koukoutu_metrics(request):
+        return web.Response(
+            body=_registry.render().encode("utf-8"),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
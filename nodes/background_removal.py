@@ -1,22 +1,7 @@
-import io
-import requests
-from PIL import Image
-
-from ..config import (
-        SYNC_API_URL,
-        SYNC_AUTH_PREFIX,
-        RETRY_STATUS_CODES,
-        MAX_RETRY_COUNT,
-        CREATE_REQUEST_TIMEOUT,
-    )
-from ..utils import (
-        tensor_to_pil, 
-        pil_to_tensor, 
-        save_temp_image, 
-        cleanup_temp_file,
-        validate_api_key,
-        code_dict
-    )
+from ..api import run_sync_batch, run_in_thread
+from ..interrupt import is_interrupt
+from ..utils import validate_api_key
+from ..handle import RESULT_TYPE, input_fingerprint
 
 
 class KoukoutuBackgroundRemoval:
@@ -29,14 +14,17 @@ class KoukoutuBackgroundRemoval:
     def INPUT_TYPES(cls):
         return {
             "required": {
-                "image": ("IMAGE",),
                 "api_key": ("STRING", {
                     "default": "",
                     "multiline": False,
-                    "placeholder": "请输入您的 Koukoutu API Key"
+                    "placeholder": "请输入您的 Koukoutu API Key（留空则使用 Key 池）"
                 }),
             },
             "optional": {
+                "image": ("IMAGE",),
+                "result": (RESULT_TYPE, {
+                    "tooltip": "上一个 Koukoutu 节点的 result 输出，连接后代替 image，直接转发原始结果",
+                }),
                 "model_key_name": (["通用抠图模型", "印花专抠模型"], {
                     "default": "通用抠图模型",
                     'placeholder': '选择模型'
@@ -60,102 +48,60 @@ class KoukoutuBackgroundRemoval:
             }
         }
     
-    RETURN_TYPES = ("IMAGE",)
-    RETURN_NAMES = ("image",)
+    RETURN_TYPES = ("IMAGE", "MASK", "MASK", RESULT_TYPE,)
+    RETURN_NAMES = ("image", "mask", "alpha", "result",)
     FUNCTION = "remove_background"
     CATEGORY = "image/koukoutu"
     DESCRIPTION = "使用 Koukoutu API 移除图像背景"
     
-    def remove_background(self, image, api_key, model_key_name, output_format="png", crop=False, stamp_crop=False, border='不增强', error_num=0):
+    async def remove_background(self, image=None, api_key="", model_key_name="通用抠图模型", output_format="png", crop=False, stamp_crop=False, border='不增强', result=None):
         """
         Remove background from image using Koukoutu API
+        Every image of the batch is sent concurrently and the results are reassembled in order
+        The IMAGE output is RGB; the transparency of the result is returned as the alpha MASK (1 = transparent, as in ComfyUI)
+        The result input forwards the raw output of a previous Koukoutu node
         """
         try:
             output_response='file'
             # Validate API key
             validated_api_key = validate_api_key(api_key)
-            # Convert ComfyUI image tensor to PIL Image
-            pil_image = tensor_to_pil(image)
-            
-            # Save image to temporary file for upload
-            temp_path = save_temp_image(pil_image, 'PNG')
-            
-            try:
-                # Prepare API request
-                api_url = SYNC_API_URL
-                
-                headers = {
-                    'Authorization': f"{SYNC_AUTH_PREFIX}{validated_api_key}"
-                }
 
-                model_key_dict = {
-                    "通用抠图模型": "background-removal",
-                    "印花专抠模型": "stamp-background-removal",
-                }
-                model_key = model_key_dict.get(model_key_name, "background-removal")
+            model_key_dict = {
+                "通用抠图模型": "background-removal",
+                "印花专抠模型": "stamp-background-removal",
+            }
+            model_key = model_key_dict.get(model_key_name, "background-removal")
+
+            border_dict = {
+                "不增强": "0",
+                "标准增强": "1",
+                "高度增强": "2"
+            }
+            data = {
+                'model_key': model_key,
+                'output_format': output_format,
+                'crop': '1' if crop else '0',
+                'stamp_crop': '1' if stamp_crop else '0',
+                'border': border_dict.get(border, "0"),
+                'response': output_response
+            }
+            return await run_in_thread(run_sync_batch, image, validated_api_key, data, result)
 
-                border_dict = {
-                    "不增强": "0",
-                    "标准增强": "1",
-                    "高度增强": "2"
-                }
-                data = {
-                    'model_key': model_key,
-                    'output_format': output_format,
-                    'crop': '1' if crop else '0',
-                    'stamp_crop': '1' if stamp_crop else '0',
-                    'border': border_dict.get(border, "0"),
-                    'response': output_response
-                }
-                # Open and upload the image file
-                files = {
-                    'image_file': ('image.jpg', open(temp_path, 'rb'), 'image/jpg')
-                }
-                # Make API request
-                response = requests.post(
-                    api_url,
-                    headers=headers,
-                    data=data,
-                    files=files,
-                    timeout=CREATE_REQUEST_TIMEOUT
-                )
-                content_type = response.headers.get('content-type', '')
-                if 'application/json' in content_type and output_response == 'file':
-                    json_response = response.json()
-                    code = json_response.get('code', 200)
-                    if code in RETRY_STATUS_CODES and error_num <= MAX_RETRY_COUNT:
-                        return self.remove_background(image, api_key, model_key_name, output_format, crop, stamp_crop, border, output_response, error_num + 1)
-                    else:
-                        raise Exception(code_dict.get(code, f"API 错误: {json_response.get('message', '未知错误')}"))
-                image_data = response.content
-                result_image = Image.open(io.BytesIO(image_data))
-                result_tensor = pil_to_tensor(result_image)
-                return (result_tensor,)
-            finally:
-                # Clean up temporary file
-                cleanup_temp_file(temp_path)
-                
-        except requests.RequestException as e:
-            if error_num <= MAX_RETRY_COUNT:
-                return self.remove_background(image, api_key, model_key_name, output_format, crop, stamp_crop, border, output_response, error_num + 1)
-            raise Exception(f"网络请求错误: {str(e)}")
         except Exception as e:
+            if is_interrupt(e):
+                raise
             raise Exception(f"背景移除失败: {str(e)}")
     
     @classmethod
-    def IS_CHANGED(cls, image, api_key, model_key_name="通用抠图模型", output_format="png", crop=False, stamp_crop=False, border='不增强', output_response='file'):
+    def IS_CHANGED(cls, image=None, api_key="", model_key_name="通用抠图模型", output_format="png", crop=False, stamp_crop=False, border='不增强', output_response='file', result=None):
         """
         This method helps ComfyUI determine when to re-execute the node
         Returns a hash of the input parameters to enable intelligent caching
         """
         import hashlib
         
-        # Convert image tensor to a hashable representation
-        if image is not None:
-            # Create a hash based on image data
-            image_hash = hashlib.md5(image.cpu().numpy().tobytes()).hexdigest()[:16]
-        else:
-            image_hash = "no_image"
+        # 连接 result 时按结果句柄计算
+        image_hash = input_fingerprint(image, result)[:16]
         
         # Create a combined hash of all parameters
         params_str = f"{image_hash}_{api_key[:8] if api_key else 'no_key'}_{model_key_name}_{output_format}_{crop}_{stamp_crop}_{border}_{output_response}"
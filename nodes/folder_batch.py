@@ -0,0 +1,141 @@
+import os
+import json
+
+import comfy.utils
+
+from ..api import run_in_thread
+from ..folder import run_folder, format_summary
+from ..interrupt import is_interrupt, raise_if_interrupted
+from ..utils import validate_api_key
+
+
+# 可选的模型（与各功能节点的 model_key 一致）
+MODEL_KEYS = [
+    "background-removal",
+    "stamp-background-removal",
+    "stamp-crop",
+    "image-to-image",
+    "image-extract",
+    "image-extract-v2",
+    "image-watermark",
+    "image-shadow-v3",
+    "upscale2stamp",
+    "image-outpaint",
+]
+
+
+class KoukoutuFolderBatch:
+    """
+    Koukoutu 文件夹批处理节点
+    把输入目录中的图像逐个流式送入所选模型，结果直接写入输出目录，不加载为 IMAGE 张量
+    """
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "input_dir": ("STRING", {
+                    "default": "",
+                    "multiline": False,
+                    "placeholder": "输入图像所在目录"
+                }),
+                "output_dir": ("STRING", {
+                    "default": "",
+                    "multiline": False,
+                    "placeholder": "结果写入的目录（不存在时自动创建）"
+                }),
+                "api_key": ("STRING", {
+                    "default": "",
+                    "multiline": False,
+                    "placeholder": "请输入您的 Koukoutu API Key（留空则使用 Key 池）"
+                }),
+                "model_key": (MODEL_KEYS, {
+                    "default": "background-removal",
+                }),
+            },
+            "optional": {
+                "params": ("STRING", {
+                    "default": "{}",
+                    "multiline": True,
+                    "tooltip": "模型参数（JSON 对象），与对应功能节点提交的表单字段相同，例如 {\"scale\": \"2\"}",
+                }),
+                "skip_error": ("BOOLEAN", {
+                    "default": True,
+                    "label_on": "跳过错误（记录失败文件后继续）",
+                    "label_off": "抛出错误（中断流程）",
+                }),
+                "overwrite": ("BOOLEAN", {
+                    "default": False,
+                    "label_on": "重新处理已有结果的文件",
+                    "label_off": "跳过已有结果的文件",
+                }),
+            }
+        }
+
+    RETURN_TYPES = ("STRING",)
+    RETURN_NAMES = ("message",)
+    FUNCTION = "process_folder"
+    OUTPUT_NODE = True
+    CATEGORY = "image/koukoutu"
+    DESCRIPTION = "使用 Koukoutu API 批量处理整个文件夹中的图像，结果直接写入输出目录"
+
+    async def process_folder(self, input_dir, output_dir, api_key, model_key,
+                             params="{}", skip_error=True, overwrite=False):
+        """
+        文件夹批处理：
+        1. 逐个读取输入目录中的图像文件，符合上传策略时原样上传，不解码
+        2. 按所选模型提交同步请求或异步任务，同时处理的文件数受 FOLDER_MAX_WORKERS 限制
+        3. 结果字节直接写入输出目录（输入文件名加结果格式的扩展名，例如 a.jpg -> a.jpg.png）
+        内存占用与文件总数无关；输出目录中已有结果的文件默认跳过
+        """
+        try:
+            # Validate API key
+            validated_api_key = validate_api_key(api_key)
+
+            extra = json.loads(params or "{}")
+            if not isinstance(extra, dict):
+                raise ValueError("params 必须是 JSON 对象")
+            data = {name: str(value) for name, value in extra.items()}
+            data['model_key'] = model_key
+
+            # 进度条在当前节点的执行上下文中创建，总数在列出文件后由 update_absolute 更新
+            pbar = comfy.utils.ProgressBar(1)
+
+            def report(done, total):
+                # 先检查中断（不清除标志），再交给会清除标志的 ComfyUI 进度钩子
+                raise_if_interrupted()
+                pbar.update_absolute(done, total)
+
+            summary = await run_in_thread(
+                run_folder, input_dir.strip(), output_dir.strip(), validated_api_key, data,
+                skip_error, overwrite, report
+            )
+            return (format_summary(summary),)
+
+        except Exception as e:
+            if is_interrupt(e):
+                raise
+            raise Exception(f"文件夹批处理失败: {str(e)}")
+
+    @classmethod
+    def IS_CHANGED(cls, input_dir, output_dir, api_key, model_key,
+                   params="{}", skip_error=True, overwrite=False):
+        """
+        This method helps ComfyUI determine when to re-execute the node
+        Returns a hash of the input parameters to enable intelligent caching
+        """
+        import hashlib
+
+        # 目录的修改时间在增删文件时变化，此时需要重新执行
+        mtimes = []
+        for path in (input_dir.strip(), output_dir.strip()):
+            try:
+                mtimes.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                mtimes.append(None)
+
+        params_str = (
+            f"{input_dir}_{output_dir}_{mtimes}_{api_key[:8] if api_key else 'no_key'}"
+            f"_{model_key}_{params}_{skip_error}_{overwrite}"
+        )
+        return hashlib.md5(params_str.encode()).hexdigest()[:16]
@@ -0,0 +1,173 @@
+"""
+Koukoutu ComfyUI Nodes — 客户端限流
+进程级令牌桶，按（API Key, 接口）分别限速，所有节点与并发 prompt 共享；
+收到 429 时按 Retry-After 暂停对应的令牌桶，避免连续触发限流
+"""
+
+import time
+import asyncio
+import threading
+from email.utils import parsedate_to_datetime
+
+from .config import (
+        RATE_LIMITS,
+        RATE_LIMITED_CODE,
+        RATE_LIMIT_DEFAULT_PAUSE,
+    )
+from .errors import KoukoutuApiError
+from .utils import code_dict
+from .interrupt import interruptible_sleep
+
+
+# 接口名称，对应 config.RATE_LIMITS 的键
+SYNC_CREATE = "sync_create"
+ASYNC_CREATE = "async_create"
+QUERY = "query"
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket that hands out reservations
+
+    reserve() always takes a token (the balance may go negative) and returns
+    how long the caller must wait before using it, so concurrent callers are
+    spread out in arrival order instead of retrying in a busy loop.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Take one token
+
+        Returns:
+            float: seconds to wait before sending the request
+        """
+        with self.lock:
+            now = time.monotonic()
+            if now > self.updated:
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+            self.tokens -= 1
+            wait = max(0.0, self.updated - now)
+            if self.tokens < 0:
+                wait += -self.tokens / self.rate
+            return wait
+
+    def available(self):
+        """
+        Tokens that could be taken right now without waiting (may be negative)
+        """
+        with self.lock:
+            now = time.monotonic()
+            if now <= self.updated:
+                return self.tokens - (self.updated - now) * self.rate
+            return min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+
+    def pause(self, seconds):
+        """
+        Stop handing out tokens for the given number of seconds
+        """
+        with self.lock:
+            until = time.monotonic() + seconds
+            if until > self.updated:
+                self.tokens = min(self.tokens, 0.0)
+                self.updated = until
+
+
+class RateLimiter:
+    """
+    Token buckets keyed by (api_key, endpoint)
+    """
+
+    def __init__(self, limits=RATE_LIMITS):
+        self._limits = limits
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, api_key, endpoint):
+        key = (api_key, endpoint)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                limit = self._limits[endpoint]
+                bucket = TokenBucket(limit["rate"], limit["burst"])
+                self._buckets[key] = bucket
+            return bucket
+
+    def acquire(self, api_key, endpoint):
+        """
+        Block the calling thread until a request may be sent
+        """
+        delay = self.bucket(api_key, endpoint).reserve()
+        if delay > 0:
+            interruptible_sleep(delay)
+
+    async def acquire_async(self, api_key, endpoint):
+        """
+        Wait on the event loop until a request may be sent
+        """
+        delay = self.bucket(api_key, endpoint).reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def pause(self, api_key, endpoint, seconds):
+        """
+        Pause an endpoint for a key, e.g. after a 429 response
+        """
+        self.bucket(api_key, endpoint).pause(seconds)
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """
+    Return the process-wide rate limiter, creating it on first use
+    """
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = RateLimiter()
+    return _limiter
+
+
+def parse_retry_after(response):
+    """
+    Seconds requested by a Retry-After header, or None
+    """
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def check_rate_limited(response, api_key, endpoint, code=None):
+    """
+    Raise a retryable KoukoutuApiError if the response is a 429
+
+    Either the HTTP status or the business code in the JSON body may carry
+    the 429. The endpoint is paused for Retry-After seconds (or
+    RATE_LIMIT_DEFAULT_PAUSE) for every caller sharing the key.
+    """
+    if response.status_code != RATE_LIMITED_CODE and code != RATE_LIMITED_CODE:
+        return
+    retry_after = parse_retry_after(response)
+    if retry_after is None:
+        retry_after = RATE_LIMIT_DEFAULT_PAUSE
+    get_rate_limiter().pause(api_key, endpoint, retry_after)
+    raise KoukoutuApiError(code_dict[RATE_LIMITED_CODE], RATE_LIMITED_CODE, retry_after)
@@ -0,0 +1,105 @@
+"""
+Koukoutu ComfyUI Nodes — 分阶段重试
+创建任务、查询任务、下载结果各自独立重试：查询失败只针对已有的 task_id 重新查询，
+下载失败只重新下载，只有创建失败才会重新提交任务，避免重复上传与重复计费
+"""
+
+import random
+import asyncio
+
+import requests
+
+from .config import MAX_RETRY_COUNT, RETRY_BACKOFF_BASE, RETRY_BACKOFF_MAX
+from .errors import KoukoutuApiError
+from .metrics import count_retry, count_error
+from .interrupt import interruptible_sleep, raise_if_interrupted
+
+
+def is_transient(error):
+    """
+    Whether an error is worth retrying (network errors, 5xx and 429 responses)
+    """
+    if isinstance(error, requests.RequestException):
+        return True
+    return isinstance(error, KoukoutuApiError) and error.retryable
+
+
+def backoff_delay(attempt):
+    """
+    Delay before retry number attempt (1-based): exponential, capped, with jitter
+    """
+    delay = min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * 2 ** (attempt - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def retry_delay(error, attempt):
+    """
+    Delay before retrying after error
+
+    Rate-limited errors return 0: the rate limiter already holds the next
+    request until Retry-After has passed.
+    """
+    if isinstance(error, KoukoutuApiError) and error.retry_after is not None:
+        return 0.0
+    return backoff_delay(attempt)
+
+
+def final_error(error):
+    """
+    Error to raise once retries are exhausted
+    """
+    if isinstance(error, requests.RequestException):
+        return Exception(f"网络请求错误: {str(error)}")
+    return error
+
+
+def call_with_retry(func, phase, stage, model_key):
+    """
+    Call func(), retrying transient errors up to MAX_RETRY_COUNT times
+
+    Args:
+        func: callable performing one phase of a request
+        phase: phase name used in log messages
+        stage: phase name used in metrics (see metrics.py)
+        model_key: model the request is sent to
+    """
+    attempt = 0
+    while True:
+        # 同步调用无法中途停止，只在每次尝试之前检查 prompt 是否已取消
+        raise_if_interrupted()
+        try:
+            return func()
+        except Exception as e:
+            count_error(model_key, e)
+            if not is_transient(e) or attempt >= MAX_RETRY_COUNT:
+                raise final_error(e)
+            attempt += 1
+            count_retry(stage, model_key)
+            delay = retry_delay(e, attempt)
+            print(f"[Koukoutu] {phase}失败，{delay:.1f} 秒后第 {attempt} 次重试: {e}")
+            interruptible_sleep(delay)
+
+
+async def call_with_retry_async(func, phase, stage, model_key):
+    """
+    Await func(), retrying transient errors up to MAX_RETRY_COUNT times
+
+    Args:
+        func: callable returning a new awaitable for one phase of a request
+        phase: phase name used in log messages
+        stage: phase name used in metrics (see metrics.py)
+        model_key: model the request is sent to
+    """
+    attempt = 0
+    while True:
+        try:
+            return await func()
+        except Exception as e:
+            count_error(model_key, e)
+            if not is_transient(e) or attempt >= MAX_RETRY_COUNT:
+                raise final_error(e)
+            attempt += 1
+            count_retry(stage, model_key)
+            delay = retry_delay(e, attempt)
+            print(f"[Koukoutu] {phase}失败，{delay:.1f} 秒后第 {attempt} 次重试: {e}")
+            await asyncio.sleep(delay)
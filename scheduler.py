@@ -0,0 +1,149 @@
+"""
+Koukoutu ComfyUI Nodes — 自适应轮询调度
+根据各模型的历史完成耗时安排首次查询，运行中按返回的 progress 外推剩余时间，
+无进度可参考时指数退避，并加入随机抖动避免大量任务同时查询
+"""
+
+import os
+import json
+import random
+import threading
+import statistics
+
+from .config import (
+        DEFAULT_POLL_INTERVAL,
+        DEFAULT_MAX_WAIT,
+        MIN_POLL_INTERVAL,
+        MAX_POLL_INTERVAL,
+        FIRST_POLL_FRACTION,
+        POLL_BACKOFF_FACTOR,
+        POLL_JITTER,
+        POLL_HISTORY_SIZE,
+        POLL_HISTORY_PARAMS,
+        POLL_HISTORY_FILE,
+    )
+
+
+def history_key(data):
+    """
+    Build the history key of a task from its form fields
+
+    Args:
+        data: form fields, including model_key
+
+    Returns:
+        str: e.g. "image-extract-v2|resolution=4k"
+    """
+    parts = [str(data.get('model_key', ''))]
+    for name in POLL_HISTORY_PARAMS:
+        if name in data:
+            parts.append(f"{name}={data[name]}")
+    return "|".join(parts)
+
+
+def _jitter(delay):
+    return delay * random.uniform(1 - POLL_JITTER, 1 + POLL_JITTER)
+
+
+class PollScheduler:
+    """
+    Decide when each outstanding task should be queried next
+    """
+
+    def __init__(self, path=POLL_HISTORY_FILE):
+        self._path = path
+        self._lock = threading.Lock()
+        # 写文件单独加锁，事件循环上读取历史时不必等待磁盘写入
+        self._save_lock = threading.Lock()
+        self._history = None
+
+    def _load(self):
+        if self._history is None:
+            try:
+                with open(self._path, 'r', encoding='utf-8') as f:
+                    self._history = json.load(f)
+            except (OSError, ValueError):
+                self._history = {}
+        return self._history
+
+    def _save(self, content):
+        try:
+            os.makedirs(os.path.dirname(self._path), exist_ok=True)
+            temp_path = f"{self._path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(content)
+            os.replace(temp_path, self._path)
+        except OSError as e:
+            print(f"[Koukoutu] 保存轮询历史失败: {e}")
+
+    def expected_duration(self, key):
+        """
+        Median of the recorded completion times for key, or None without history
+        """
+        with self._lock:
+            durations = self._load().get(key)
+            if not durations:
+                return None
+            return statistics.median(durations)
+
+    def record(self, key, duration):
+        """
+        Record the observed completion time of a finished task
+
+        Writes the history file, so call it off the engine loop (see
+        TaskEngine.run_blocking).
+        """
+        with self._save_lock:
+            with self._lock:
+                durations = self._load().setdefault(key, [])
+                durations.append(round(duration, 2))
+                del durations[:-POLL_HISTORY_SIZE]
+                content = json.dumps(self._history)
+            self._save(content)
+
+    def first_delay(self, key):
+        """
+        Delay between task creation and the first query
+        """
+        expected = self.expected_duration(key)
+        if expected is None:
+            return DEFAULT_POLL_INTERVAL
+        delay = _jitter(expected * FIRST_POLL_FRACTION)
+        return min(max(delay, MIN_POLL_INTERVAL), DEFAULT_MAX_WAIT)
+
+    def next_delay(self, key, elapsed, progress, previous_delay):
+        """
+        Delay until the next query of a task that is still running
+
+        Args:
+            key: history key of the task
+            elapsed: seconds since the task was created
+            progress: last reported progress (0-100)
+            previous_delay: delay used before the last query
+        """
+        if 0 < progress < 100:
+            # 按当前进度线性外推剩余时间
+            delay = elapsed * (100 - progress) / progress
+        else:
+            expected = self.expected_duration(key)
+            if expected is not None and elapsed < expected:
+                delay = expected - elapsed
+            else:
+                delay = previous_delay * POLL_BACKOFF_FACTOR
+        return min(max(_jitter(delay), MIN_POLL_INTERVAL), MAX_POLL_INTERVAL)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """
+    Return the process-wide poll scheduler, creating it on first use
+    """
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = PollScheduler()
+    return _scheduler
@@ -0,0 +1,120 @@
+"""
+Koukoutu ComfyUI Nodes — 请求合并（single-flight）
+以结果缓存键（输入摘要, model_key, 参数）标识请求：同一时刻多个 prompt / 文件提交相同的请求时，
+只有第一个真正调用 API，其余等待并共享它的结果，不重复计费，也不增加队列负载
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Future
+
+from .errors import KoukoutuTaskError
+from .interrupt import interruptible_result
+
+
+class _Abandoned(Exception):
+    """
+    The leading caller stopped (cancelled, or failed for reasons of its own)
+    """
+
+
+class SingleFlight:
+    """
+    Registry of requests currently in flight, shared by threads and the engine loop
+
+    The first caller of a key becomes its leader and must resolve() it; the
+    others receive the leader's concurrent Future.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def join(self, key):
+        """
+        Returns:
+            tuple: (Future of the result, True if the caller is the leader)
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                return future, False
+            future = self._calls[key] = Future()
+            return future, True
+
+    def resolve(self, key, result=None, error=None):
+        """
+        Publish the leader's result (or error) and forget the key
+        """
+        with self._lock:
+            future = self._calls.pop(key, None)
+        if future is None:
+            return
+        if error is None:
+            future.set_result(result)
+        else:
+            # 只有任务本身失败（state=2）对所有调用方都成立；其余错误（Key 无效、取消等）
+            # 只属于发起方，等待方会自行重新发起请求
+            future.set_exception(error if isinstance(error, KoukoutuTaskError) else _Abandoned(str(error)))
+
+
+_flights = SingleFlight()
+
+
+def get_flights():
+    """
+    Return the process-wide single-flight registry
+    """
+    return _flights
+
+
+def share(key, func):
+    """
+    Call func() unless an identical request is in flight, then wait for its result
+
+    Returns:
+        result of func (possibly computed by another caller)
+
+    Raises:
+        KoukoutuTaskError: If the shared task failed
+    """
+    while True:
+        future, leader = _flights.join(key)
+        if leader:
+            break
+        try:
+            return interruptible_result(future)
+        except _Abandoned:
+            continue
+    try:
+        result = func()
+    except BaseException as e:
+        _flights.resolve(key, error=e)
+        raise
+    _flights.resolve(key, result)
+    return result
+
+
+async def share_async(key, func):
+    """
+    Await func() unless an identical request is in flight (see share)
+    """
+    while True:
+        future, leader = _flights.join(key)
+        if leader:
+            break
+        try:
+            return await asyncio.wrap_future(future)
+        except _Abandoned:
+            continue
+    try:
+        result = await func()
+    except BaseException as e:
+        _flights.resolve(key, error=e)
+        raise
+    _flights.resolve(key, result)
+    return result
+
+
+def is_abandoned(error):
+    return isinstance(error, _Abandoned)
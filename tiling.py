@@ -0,0 +1,111 @@
+"""
+Koukoutu ComfyUI Nodes — 分块处理
+把超出上传限制或处理很慢的大图切成相互重叠的分块，各分块作为独立任务并发提交，
+结果按线性权重在重叠区域羽化融合回一张图，接缝不可见
+"""
+
+import numpy as np
+import torch
+from PIL import Image
+
+from .config import TILE_POLICIES
+from .utils import pil_to_tensor
+
+
+def get_tile_policy(model_key):
+    """
+    Returns:
+        dict: tile / overlap of the model, or None if it does not support tiling
+    """
+    return TILE_POLICIES.get(model_key)
+
+
+def _axis_starts(length, tile, overlap):
+    if length <= tile:
+        return [0]
+    stride = tile - overlap
+    starts = list(range(0, length - tile, stride))
+    # 最后一个分块与图像边缘对齐，与前一块的重叠可能大于 overlap
+    starts.append(length - tile)
+    return starts
+
+
+def tile_boxes(height, width, tile, overlap):
+    """
+    Cover an image with overlapping tiles
+
+    Returns:
+        list: (top, left, height, width) of every tile, row by row
+    """
+    if overlap >= tile:
+        raise ValueError(f"分块重叠宽度 {overlap} 必须小于分块边长 {tile}")
+    return [
+        (top, left, min(tile, height), min(tile, width))
+        for top in _axis_starts(height, tile, overlap)
+        for left in _axis_starts(width, tile, overlap)
+    ]
+
+
+def split_tiles(pixels, boxes):
+    """
+    Cut the tiles out of quantized pixels [H, W, C]
+
+    Returns:
+        list: contiguous uint8 arrays, one per box
+    """
+    return [np.ascontiguousarray(pixels[top:top + h, left:left + w]) for top, left, h, w in boxes]
+
+
+def _ramp(length, before, after):
+    """
+    1-D feathering weights of a tile: linear ramps over the overlapping ends
+    """
+    weights = torch.ones(length, dtype=torch.float32)
+    for size, edge in ((before, slice(0, before)), (after, slice(length - after, length))):
+        size = min(size, length)
+        if size <= 0:
+            continue
+        ramp = torch.arange(1, size + 1, dtype=torch.float32) / (size + 1)
+        weights[edge] = ramp if edge.start == 0 else ramp.flip(0)
+    return weights
+
+
+def blend_tiles(images, boxes, height, width, overlap):
+    """
+    Blend processed tiles back into one image
+
+    The output scale is taken from the first tile (e.g. 2x for an upscale).
+    Each tile is weighted by the outer product of two linear ramps over the
+    sides it shares with a neighbour, and the weighted sum is normalized, so
+    overlapping regions fade smoothly from one tile into the next.
+
+    Args:
+        images: processed PIL Image of every tile
+        boxes: input boxes of the tiles (see tile_boxes)
+        height, width: input image size
+        overlap: tile overlap in input pixels
+
+    Returns:
+        tensor: IMAGE [1, H * scale, W * scale, 3]
+    """
+    scale_y = images[0].height / boxes[0][2]
+    scale_x = images[0].width / boxes[0][3]
+    out_h, out_w = round(height * scale_y), round(width * scale_x)
+    canvas = torch.zeros((out_h, out_w, 3), dtype=torch.float32)
+    weight_sum = torch.zeros((out_h, out_w, 1), dtype=torch.float32)
+    feather_y, feather_x = round(overlap * scale_y), round(overlap * scale_x)
+
+    for image, (top, left, h, w) in zip(images, boxes):
+        y0, y1 = round(top * scale_y), round((top + h) * scale_y)
+        x0, x1 = round(left * scale_x), round((left + w) * scale_x)
+        if image.size != (x1 - x0, y1 - y0):
+            image = image.resize((x1 - x0, y1 - y0), Image.BICUBIC)
+        tile = pil_to_tensor(image)[0]
+        weights = (
+            _ramp(y1 - y0, feather_y if top > 0 else 0, feather_y if top + h < height else 0)[:, None]
+            * _ramp(x1 - x0, feather_x if left > 0 else 0, feather_x if left + w < width else 0)[None, :]
+        )[:, :, None]
+        canvas[y0:y1, x0:x1] += tile * weights
+        weight_sum[y0:y1, x0:x1] += weights
+
+    return (canvas / weight_sum.clamp_min(1e-6)).unsqueeze(0)
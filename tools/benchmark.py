@@ -0,0 +1,274 @@
+"""
+Koukoutu 节点端到端压测
+启动本地模拟服务（tools/mock_server.py），让每个节点类在不同并发数与图像尺寸下反复执行，
+统计延迟分位数（p50/p95/p99）、吞吐量、收发字节数以及按阶段划分的 CPU 时间，
+结果写入 JSON，便于不同版本之间对比
+
+需要在 ComfyUI 环境中运行（节点依赖 comfy.utils），例如在 ComfyUI 根目录下：
+    python custom_nodes/comfyui-koukoutu/tools/benchmark.py --output bench.json
+或指定 ComfyUI 目录：
+    python tools/benchmark.py --comfyui-root /path/to/ComfyUI --concurrency 1,4,16 --sizes 256,1024
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import tempfile
+import asyncio
+import argparse
+import threading
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+PACKAGE_DIR = os.path.dirname(TOOLS_DIR)
+sys.path.insert(0, TOOLS_DIR)
+
+from mock_server import MockKoukoutuServer, MockSettings  # noqa: E402
+
+
+# 节点类名 -> (模块名, 执行方法, 除 image/api_key 外的参数)
+NODES = {
+    "KoukoutuBackgroundRemoval": ("background_removal", "remove_background", {"model_key_name": "通用抠图模型"}),
+    "KoukoutuStampCrop":         ("stamp_crop", "stamp_crop", {}),
+    "KoukoutuImageToImage":      ("image_to_image", "image_to_image", {"prompt": "benchmark"}),
+    "KoukoutuImageExtract":      ("image_extract", "image_extract", {"extract_type": "服装"}),
+    "KoukoutuImageExtractV2":    ("image_extract_v2", "image_extract_v2", {"extract_type": "服装"}),
+    "KoukoutuWatermarkRemoval":  ("watermark_removal", "remove_watermark", {}),
+    "KoukoutuAIShadow":          ("ai_shadow", "generate_shadow", {}),
+    "KoukoutuUpscale":           ("upscale", "upscale", {"scale": "2"}),
+    "KoukoutuOutpaint":          ("outpaint", "outpaint", {"top": 16}),
+}
+
+
+class PhaseTimer:
+    """
+    Accumulate per-thread CPU time of wrapped functions by phase name
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.cpu = {}
+        self.calls = {}
+
+    def wrap(self, module, name, phase):
+        func = getattr(module, name)
+        timer = self
+
+        def wrapper(*args, **kwargs):
+            start = time.thread_time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.thread_time() - start
+                with timer._lock:
+                    timer.cpu[phase] = timer.cpu.get(phase, 0.0) + elapsed
+                    timer.calls[phase] = timer.calls.get(phase, 0) + 1
+
+        setattr(module, name, wrapper)
+
+    def reset(self):
+        with self._lock:
+            self.cpu = {}
+            self.calls = {}
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                phase: {"cpu_seconds": round(seconds, 6), "calls": self.calls[phase]}
+                for phase, seconds in sorted(self.cpu.items())
+            }
+
+
+def _import_package(comfyui_root):
+    if comfyui_root not in sys.path:
+        sys.path.insert(0, comfyui_root)
+    spec = importlib.util.spec_from_file_location(
+        "koukoutu_bench",
+        os.path.join(PACKAGE_DIR, "__init__.py"),
+        submodule_search_locations=[PACKAGE_DIR],
+    )
+    package = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = package
+    spec.loader.exec_module(package)
+    return spec.name
+
+
+def _instrument(package_name, timer):
+    api = sys.modules[f"{package_name}.api"]
+    engine = sys.modules[f"{package_name}.engine"]
+    timer.wrap(api, "batch_fingerprints", "fingerprint")
+    timer.wrap(api, "quantize_tensor", "quantize")
+    timer.wrap(api, "encode_for_upload", "encode")
+    timer.wrap(api, "stack_batch", "stack_batch")
+    timer.wrap(api, "http_post", "http_sync")
+    timer.wrap(api, "decode_image", "decode_sync")
+    timer.wrap(engine, "http_post", "http_async")
+    timer.wrap(engine, "http_get", "http_download")
+    timer.wrap(engine, "decode_image", "decode")
+
+
+def percentile(values, q):
+    """
+    Linear-interpolated percentile of a list (q in 0-100)
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def run_scenario(node, method, kwargs, size, batch, concurrency, calls):
+    """
+    Execute a node `calls` times with `concurrency` concurrent callers
+
+    Returns:
+        tuple: (latencies in seconds, wall time, errors)
+    """
+    import torch
+
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def one_call(_):
+        image = torch.rand(batch, size, size, 3)
+        start = time.perf_counter()
+        try:
+            # 节点 FUNCTION 是协程，每个客户端线程用自己的事件循环等待
+            asyncio.run(getattr(node, method)(image, "benchmark-key", **kwargs))
+        except Exception as e:
+            with lock:
+                errors.append(str(e))
+            return
+        with lock:
+            latencies.append(time.perf_counter() - start)
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one_call, range(calls)))
+    return latencies, time.perf_counter() - wall_start, errors
+
+
+def _package_version():
+    try:
+        with open(os.path.join(PACKAGE_DIR, "pyproject.toml"), encoding="utf-8") as f:
+            for line in f:
+                if line.strip().startswith("version"):
+                    return line.split("=", 1)[1].strip().strip('"')
+    except OSError:
+        pass
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Koukoutu 节点端到端压测")
+    parser.add_argument("--comfyui-root", default=os.path.dirname(os.path.dirname(PACKAGE_DIR)),
+                        help="ComfyUI 根目录（用于导入 comfy.utils），默认为插件所在 custom_nodes 的上级目录")
+    parser.add_argument("--nodes", default=",".join(NODES), help="要压测的节点类，逗号分隔")
+    parser.add_argument("--concurrency", default="1,4,16", help="并发调用数，逗号分隔")
+    parser.add_argument("--sizes", default="256,1024", help="输入图像边长（像素），逗号分隔")
+    parser.add_argument("--batch", type=int, default=1, help="每次调用的 IMAGE 批次大小")
+    parser.add_argument("--calls", type=int, default=32, help="每个场景的调用次数")
+    parser.add_argument("--latency", default="const:0.01", help="模拟服务的请求延迟分布")
+    parser.add_argument("--task-duration", default="uniform:0.5,1.5", help="模拟服务的任务时长分布")
+    parser.add_argument("--fail-5xx", type=float, default=0.0)
+    parser.add_argument("--fail-429", type=float, default=0.0)
+    parser.add_argument("--output", default="bench_output.json", help="结果 JSON 文件")
+    args = parser.parse_args(argv)
+
+    settings = MockSettings(
+        latency=args.latency,
+        task_duration=args.task_duration,
+        fail_5xx=args.fail_5xx,
+        fail_429=args.fail_429,
+    )
+    server = MockKoukoutuServer(settings=settings)
+    base_url = server.start()
+
+    # 必须在导入节点包之前设置：API 地址与数据目录在 config.py 导入时确定
+    os.environ["KOUKOUTU_API_BASE"] = base_url
+    os.environ["KOUKOUTU_RESULT_CACHE"] = "0"
+    os.environ["KOUKOUTU_DATA_DIR"] = tempfile.mkdtemp(prefix="koukoutu-bench-")
+
+    package_name = _import_package(args.comfyui_root)
+    timer = PhaseTimer()
+    _instrument(package_name, timer)
+
+    results = []
+    for class_name in args.nodes.split(","):
+        module_name, method, kwargs = NODES[class_name]
+        module = importlib.import_module(f"{package_name}.nodes.{module_name}")
+        node = getattr(module, class_name)()
+        for size in (int(s) for s in args.sizes.split(",")):
+            for concurrency in (int(c) for c in args.concurrency.split(",")):
+                server.reset_stats()
+                timer.reset()
+                cpu_start = time.process_time()
+                latencies, wall, errors = run_scenario(
+                    node, method, kwargs, size, args.batch, concurrency, args.calls
+                )
+                cpu_total = time.process_time() - cpu_start
+                images = len(latencies) * args.batch
+                result = {
+                    "node": class_name,
+                    "size": size,
+                    "batch": args.batch,
+                    "concurrency": concurrency,
+                    "calls": args.calls,
+                    "errors": len(errors),
+                    "latency_seconds": {
+                        "p50": percentile(latencies, 50),
+                        "p95": percentile(latencies, 95),
+                        "p99": percentile(latencies, 99),
+                        "mean": sum(latencies) / len(latencies) if latencies else None,
+                    },
+                    "wall_seconds": wall,
+                    "throughput_images_per_second": images / wall if wall else None,
+                    "wire": server.stats(),
+                    "cpu": {
+                        "process_seconds": cpu_total,
+                        "phases": timer.snapshot(),
+                    },
+                }
+                if errors:
+                    result["error_samples"] = errors[:3]
+                results.append(result)
+                p50 = result["latency_seconds"]["p50"]
+                print(
+                    f"{class_name:<28} size={size:<5} c={concurrency:<3} "
+                    f"p50={p50 if p50 is None else round(p50, 3)}s "
+                    f"thr={result['throughput_images_per_second']:.2f} img/s errors={len(errors)}"
+                )
+
+    server.stop()
+    report = {
+        "meta": {
+            "version": _package_version(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "batch": args.batch,
+            "calls": args.calls,
+            "mock_server": {
+                "latency": args.latency,
+                "task_duration": args.task_duration,
+                "fail_5xx": args.fail_5xx,
+                "fail_429": args.fail_429,
+            },
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""
+Koukoutu 文件夹批处理命令行入口
+与「抠抠图-文件夹批处理」节点相同：把输入目录中的图像逐个流式送入所选模型，结果写入输出目录，
+不需要启动 ComfyUI 界面，内存占用与图像总数无关
+
+不需要 ComfyUI，只需安装 requirements.txt 中的依赖，可以在单独的小型机器上运行：
+    python tools/folder_batch.py ./in ./out --model upscale2stamp --params '{"scale": "2"}'
+API Key 通过 --api-key 指定，留空则使用 Key 池（KOUKOUTU_API_KEYS / Key 文件）
+"""
+
+import os
+import sys
+import json
+import argparse
+import importlib
+import importlib.util
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+PACKAGE_DIR = os.path.dirname(TOOLS_DIR)
+
+
+def _import_package():
+    spec = importlib.util.spec_from_file_location(
+        "koukoutu_folder",
+        os.path.join(PACKAGE_DIR, "__init__.py"),
+        submodule_search_locations=[PACKAGE_DIR],
+    )
+    package = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = package
+    # 不执行 __init__.py：它注册全部 ComfyUI 节点（依赖 comfy），这里只需要 folder 等子模块
+    return spec.name
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Koukoutu 文件夹批处理")
+    parser.add_argument("input_dir", help="输入图像所在目录")
+    parser.add_argument("output_dir", help="结果写入的目录")
+    parser.add_argument("--model", required=True, help="model_key，例如 background-removal、upscale2stamp")
+    parser.add_argument("--params", default="{}", help="模型参数（JSON 对象）")
+    parser.add_argument("--api-key", default="", help="API Key，留空则使用 Key 池")
+    parser.add_argument("--workers", type=int, default=None, help="同时处理的图像数，默认 FOLDER_MAX_WORKERS")
+    parser.add_argument("--overwrite", action="store_true", help="重新处理输出目录中已有结果的文件")
+    parser.add_argument("--fail-fast", action="store_true", help="遇到第一个失败文件即中止")
+    args = parser.parse_args(argv)
+
+    package_name = _import_package()
+    folder = importlib.import_module(f"{package_name}.folder")
+    utils = importlib.import_module(f"{package_name}.utils")
+
+    data = {name: str(value) for name, value in json.loads(args.params).items()}
+    data["model_key"] = args.model
+    kwargs = {"max_workers": args.workers} if args.workers else {}
+
+    def report(done, total):
+        print(f"\r{done}/{total}", end="", flush=True)
+
+    summary = folder.run_folder(
+        args.input_dir, args.output_dir, utils.validate_api_key(args.api_key), data,
+        skip_error=not args.fail_fast, overwrite=args.overwrite, on_progress=report, **kwargs
+    )
+    print()
+    print(folder.format_summary(summary))
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,418 @@
+"""
+Koukoutu API 本地模拟服务
+实现节点依赖的同步 /v1/create、异步 /v1/create 与 /v1/query 接口契约，
+用于离线测试与压测，不需要真实的 sync.koukoutu.com / async.koukoutu.com
+
+接口：
+    POST /sync/v1/create    同步抠图，成功返回图像，失败返回 {"code", "message"}
+    POST /async/v1/create   创建异步任务，返回 {"code": 200, "data": {"task_id"}}
+    POST /async/v1/query    查询任务，返回 state / progress / result_file / message
+    POST /async/v1/cancel   取消运行中的任务，之后查询返回 state=2（真实 API 的取消接口的本地替身）
+    GET  /files/<task_id>   下载结果图像
+    GET  /stats             请求计数与收发字节数（JSON）
+    POST /stats/reset       清零统计
+
+用法：
+    python tools/mock_server.py --port 8765 --task-duration lognormal:0.7,0.4 --fail-5xx 0.05
+    KOUKOUTU_API_BASE=http://127.0.0.1:8765 python main.py    # 让节点指向模拟服务
+
+延迟分布写法：const:S、uniform:A,B、normal:MU,SIGMA、lognormal:MU,SIGMA、exp:MEAN（单位秒）
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import itertools
+import threading
+import importlib.util
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from PIL import Image
+
+
+def _load_code_dict():
+    # config.py 不依赖包内其他模块，直接按路径加载，保证错误码与节点一致
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config.py")
+    spec = importlib.util.spec_from_file_location("_koukoutu_config", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.CODE_DICT
+
+
+CODE_DICT = _load_code_dict()
+
+
+def parse_distribution(spec):
+    """
+    Parse a latency distribution spec into a sampler returning seconds
+
+    Args:
+        spec: "const:S", "uniform:A,B", "normal:MU,SIGMA", "lognormal:MU,SIGMA" or "exp:MEAN"
+
+    Returns:
+        callable: sampler() -> float (never negative)
+    """
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v]
+    samplers = {
+        "const": lambda: values[0],
+        "uniform": lambda: random.uniform(values[0], values[1]),
+        "normal": lambda: random.gauss(values[0], values[1]),
+        "lognormal": lambda: random.lognormvariate(values[0], values[1]),
+        "exp": lambda: random.expovariate(1.0 / values[0]),
+    }
+    if kind not in samplers:
+        raise ValueError(f"未知的延迟分布: {spec}")
+    sampler = samplers[kind]
+    return lambda: max(0.0, sampler())
+
+
+class MockSettings:
+    """
+    Behaviour of the mock server
+
+    Args:
+        latency: distribution spec of the per-request handling latency
+        task_duration: distribution spec of the async task processing time
+        fail_5xx: probability that a create/query request returns a 5xx code
+        fail_429: probability that a request is rejected with 429 + Retry-After
+        fail_409: probability that a create request fails with 409 (积分不足)
+        task_fail: probability that an async task ends with state=2
+        retry_after: Retry-After seconds sent with 429 responses
+        exhausted_keys: API keys whose create requests always fail with 409
+    """
+
+    def __init__(self, latency="const:0", task_duration="uniform:0.5,1.5",
+                 fail_5xx=0.0, fail_429=0.0, fail_409=0.0, task_fail=0.0, retry_after=1,
+                 exhausted_keys=()):
+        self.latency = parse_distribution(latency)
+        self.task_duration = parse_distribution(task_duration)
+        self.fail_5xx = fail_5xx
+        self.fail_429 = fail_429
+        self.fail_409 = fail_409
+        self.task_fail = task_fail
+        self.retry_after = retry_after
+        self.exhausted_keys = set(exhausted_keys)
+
+
+class _Task:
+    __slots__ = ("task_id", "created", "duration", "failed", "result", "cancelled")
+
+    def __init__(self, task_id, duration, failed, result):
+        self.task_id = task_id
+        self.created = time.monotonic()
+        self.duration = duration
+        self.failed = failed
+        self.result = result
+        self.cancelled = False
+
+
+def _parse_form(content_type, body):
+    """
+    Parse a multipart/form-data or urlencoded body into (fields, files)
+    """
+    fields, files = {}, {}
+    if content_type.startswith("multipart/form-data"):
+        message = BytesParser(policy=HTTP).parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode() + body
+        )
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            if part.get_filename() is not None:
+                files[name] = part.get_payload(decode=True)
+            else:
+                fields[name] = part.get_payload(decode=True).decode("utf-8")
+    else:
+        for name, values in parse_qs(body.decode("utf-8")).items():
+            fields[name] = values[0]
+    return fields, files
+
+
+def _make_result(image_bytes, fields):
+    """
+    Build a plausible result image from the upload (scaled for upscale models)
+    """
+    image = Image.open(io.BytesIO(image_bytes)).convert("RGBA")
+    scale = fields.get("scale")
+    if scale:
+        image = image.resize((image.width * int(scale), image.height * int(scale)))
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG", compress_level=1)
+    return buffer.getvalue()
+
+
+class MockKoukoutuServer:
+    """
+    Threaded local stand-in for the Koukoutu sync and async APIs
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, settings=None):
+        self.settings = settings or MockSettings()
+        self._tasks = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.mock = self
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """
+        Serve in a background thread
+
+        Returns:
+            str: base URL to use as KOUKOUTU_API_BASE
+        """
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def serve_forever(self):
+        self._httpd.serve_forever()
+
+    # ---- 统计 ----
+
+    def count(self, endpoint, received, sent):
+        with self._lock:
+            entry = self._stats.setdefault(endpoint, {"requests": 0, "bytes_received": 0, "bytes_sent": 0})
+            entry["requests"] += 1
+            entry["bytes_received"] += received
+            entry["bytes_sent"] += sent
+
+    def stats(self):
+        with self._lock:
+            return json.loads(json.dumps(self._stats))
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = {}
+
+    # ---- 接口实现 ----
+
+    def _injected_error(self, allow_409=False):
+        settings = self.settings
+        roll = random.random()
+        if roll < settings.fail_429:
+            return 429
+        roll -= settings.fail_429
+        if roll < settings.fail_5xx:
+            return random.choice([500, 502, 503])
+        roll -= settings.fail_5xx
+        if allow_409 and roll < settings.fail_409:
+            return 409
+        return None
+
+    def sync_create(self, api_key, fields, files):
+        if "image_file" not in files:
+            return 422, None
+        if api_key in self.settings.exhausted_keys:
+            return 409, None
+        error = self._injected_error(allow_409=True)
+        if error:
+            return error, None
+        return 200, _make_result(files["image_file"], fields)
+
+    def async_create(self, api_key, fields, files):
+        if "image_file" not in files:
+            return 422, None
+        if api_key in self.settings.exhausted_keys:
+            return 409, None
+        error = self._injected_error(allow_409=True)
+        if error:
+            return error, None
+        settings = self.settings
+        task = _Task(
+            next(self._ids),
+            settings.task_duration(),
+            random.random() < settings.task_fail,
+            _make_result(files["image_file"], fields),
+        )
+        with self._lock:
+            self._tasks[task.task_id] = task
+        return 200, {"task_id": task.task_id}
+
+    def query(self, fields, result_base):
+        error = self._injected_error()
+        if error:
+            return error, None
+        try:
+            task_id = int(fields.get("task_id", ""))
+        except ValueError:
+            return 422, None
+        with self._lock:
+            task = self._tasks.get(task_id)
+        if task is None:
+            return 404, None
+        if task.cancelled:
+            return 200, {"state": 2, "message": "任务已取消"}
+        elapsed = time.monotonic() - task.created
+        if elapsed < task.duration:
+            progress = int(elapsed / task.duration * 100) if task.duration else 0
+            return 200, {"state": 0, "progress": str(progress)}
+        if task.failed:
+            return 200, {"state": 2, "message": "模拟任务处理失败"}
+        return 200, {"state": 1, "progress": "100", "result_file": f"{result_base}/files/{task_id}"}
+
+    def cancel(self, fields):
+        try:
+            task_id = int(fields.get("task_id", ""))
+        except ValueError:
+            return 422, None
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is None:
+                return 404, None
+            task.cancelled = True
+        return 200, {"task_id": task_id}
+
+    def result(self, task_id):
+        with self._lock:
+            task = self._tasks.get(task_id)
+        return task.result if task is not None else None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def mock(self):
+        return self.server.mock
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length) if length else b""
+
+    def _send(self, status, body, content_type, endpoint, received, extra_headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (extra_headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        self.mock.count(endpoint, received, len(body))
+
+    def _send_json(self, code, data, endpoint, received):
+        payload = {"code": code, "message": CODE_DICT.get(code, "")}
+        if data is not None:
+            payload["data"] = data
+        headers = {}
+        if code == 429:
+            headers["Retry-After"] = str(self.mock.settings.retry_after)
+        status = code if code in CODE_DICT and code != 200 else 200
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self._send(status, body, "application/json", endpoint, received, headers)
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        body = self._read_body()
+        received = len(body)
+        if path == "/stats/reset":
+            self.mock.reset_stats()
+            self._send(200, b"{}", "application/json", "stats", received)
+            return
+
+        time.sleep(self.mock.settings.latency())
+        fields, files = _parse_form(self.headers.get("Content-Type", ""), body)
+
+        if path == "/sync/v1/create":
+            if not self.headers.get("Authorization", "").startswith("Bearer "):
+                self._send_json(401, None, "sync_create", received)
+                return
+            api_key = self.headers["Authorization"][len("Bearer "):]
+            code, result = self.mock.sync_create(api_key, fields, files)
+            if code == 200:
+                self._send(200, result, "image/png", "sync_create", received)
+            else:
+                self._send_json(code, None, "sync_create", received)
+        elif path in ("/async/v1/create", "/async/v1/query", "/async/v1/cancel"):
+            endpoint = {"create": "async_create", "query": "query", "cancel": "cancel"}[path.rsplit("/", 1)[1]]
+            if not self.headers.get("X-API-Key"):
+                self._send_json(401, None, endpoint, received)
+                return
+            if endpoint == "async_create":
+                code, data = self.mock.async_create(self.headers["X-API-Key"], fields, files)
+            elif endpoint == "cancel":
+                code, data = self.mock.cancel(fields)
+            else:
+                code, data = self.mock.query(fields, f"http://{self.headers.get('Host')}")
+            self._send_json(code, data, endpoint, received)
+        else:
+            self._send_json(404, None, "other", received)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/stats":
+            body = json.dumps(self.mock.stats()).encode("utf-8")
+            self._send(200, body, "application/json", "stats", 0)
+            return
+        if path.startswith("/files/"):
+            time.sleep(self.mock.settings.latency())
+            try:
+                result = self.mock.result(int(path.rsplit("/", 1)[1]))
+            except ValueError:
+                result = None
+            if result is None:
+                self._send(404, b"", "text/plain", "download", 0)
+            else:
+                self._send(200, result, "image/png", "download", 0)
+            return
+        self._send(404, b"", "text/plain", "other", 0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Koukoutu API 本地模拟服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", default="const:0", help="每个请求的处理延迟分布")
+    parser.add_argument("--task-duration", default="uniform:0.5,1.5", help="异步任务处理时长分布")
+    parser.add_argument("--fail-5xx", type=float, default=0.0, help="返回 5xx 的概率")
+    parser.add_argument("--fail-429", type=float, default=0.0, help="返回 429 的概率")
+    parser.add_argument("--fail-409", type=float, default=0.0, help="创建任务返回 409 的概率")
+    parser.add_argument("--task-fail", type=float, default=0.0, help="任务以 state=2 结束的概率")
+    parser.add_argument("--retry-after", type=int, default=1, help="429 响应携带的 Retry-After（秒）")
+    parser.add_argument("--exhausted-keys", default="", help="创建任务总是返回 409 的 API Key，逗号分隔")
+    args = parser.parse_args(argv)
+
+    settings = MockSettings(
+        latency=args.latency,
+        task_duration=args.task_duration,
+        fail_5xx=args.fail_5xx,
+        fail_429=args.fail_429,
+        fail_409=args.fail_409,
+        task_fail=args.task_fail,
+        retry_after=args.retry_after,
+        exhausted_keys=[key for key in args.exhausted_keys.split(",") if key],
+    )
+    server = MockKoukoutuServer(args.host, args.port, settings)
+    print(f"Koukoutu 模拟服务已启动: {server.base_url}")
+    print(f"设置 KOUKOUTU_API_BASE={server.base_url} 后启动 ComfyUI 即可使用")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+"""
+Koukoutu ComfyUI Nodes — 上传编码策略
+按 model_key 选择上传格式与压缩参数，并在发送前自动缩小图像，
+保证不超过模型的有效分辨率与 API 的文件大小上限
+"""
+
+import io
+import math
+
+from PIL import Image
+
+from .config import (
+        UPLOAD_MAX_BYTES,
+        UPLOAD_POLICIES,
+        DEFAULT_UPLOAD_POLICY,
+    )
+from .utils import encode_image
+from .errors import KoukoutuApiError
+
+
+_FORMATS = {
+    "PNG": ("image.png", "image/png"),
+    "JPEG": ("image.jpg", "image/jpeg"),
+    "WEBP": ("image.webp", "image/webp"),
+}
+
+# 有损格式超出大小上限时，先逐级降低质量，仍超出再缩小尺寸
+_MIN_QUALITY = 80
+_QUALITY_STEP = 5
+
+# 每轮缩小时在理论比例之外额外保留的余量
+_SCALE_MARGIN = 0.95
+
+_MAX_ATTEMPTS = 8
+
+
+def get_upload_policy(model_key):
+    """
+    Upload policy of a model (see UPLOAD_POLICIES in config.py)
+    """
+    return UPLOAD_POLICIES.get(model_key, DEFAULT_UPLOAD_POLICY)
+
+
+def _resize_to_side(pil_image, max_side):
+    width, height = pil_image.size
+    longest = max(width, height)
+    if not max_side or longest <= max_side:
+        return pil_image
+    scale = max_side / longest
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return pil_image.resize(size, Image.LANCZOS)
+
+
+def _encode(pil_image, policy, quality):
+    image_format = policy["format"]
+    if image_format == "JPEG":
+        if pil_image.mode != "RGB":
+            pil_image = pil_image.convert("RGB")
+        return encode_image(pil_image, "JPEG", quality=quality, subsampling=0)
+    if image_format == "WEBP":
+        if policy.get("lossless", False):
+            return encode_image(pil_image, "WEBP", lossless=True, method=4)
+        return encode_image(pil_image, "WEBP", quality=quality, method=4)
+    return encode_image(pil_image, "PNG", compress_level=policy.get("compress_level", 6))
+
+
+def encode_for_upload(pil_image, model_key, max_bytes=UPLOAD_MAX_BYTES):
+    """
+    Encode an image for upload according to the policy of model_key
+
+    The image is first limited to the policy max_side. If the encoded file
+    is still larger than max_bytes, lossy formats lower the quality down to
+    a floor, then the image is downscaled until it fits.
+
+    Args:
+        pil_image: PIL Image to upload
+        model_key: model the image is sent to
+        max_bytes: upload size limit
+
+    Returns:
+        tuple: (filename, bytes, mime type) sent as image_file
+
+    Raises:
+        KoukoutuApiError: (code 413) If the image still exceeds max_bytes
+    """
+    policy = get_upload_policy(model_key)
+    filename, mime_type = _FORMATS[policy["format"]]
+    lossy = policy["format"] == "JPEG" or (policy["format"] == "WEBP" and not policy.get("lossless", False))
+    quality = policy.get("quality", 95)
+
+    pil_image = _resize_to_side(pil_image, policy.get("max_side"))
+    image_bytes = _encode(pil_image, policy, quality)
+
+    attempts = 0
+    while len(image_bytes) > max_bytes and attempts < _MAX_ATTEMPTS:
+        attempts += 1
+        if lossy and quality - _QUALITY_STEP >= _MIN_QUALITY:
+            quality -= _QUALITY_STEP
+        else:
+            # 文件大小近似与像素数成正比
+            scale = math.sqrt(max_bytes / len(image_bytes)) * _SCALE_MARGIN
+            longest = max(pil_image.size)
+            pil_image = _resize_to_side(pil_image, max(1, int(longest * scale)))
+        image_bytes = _encode(pil_image, policy, quality)
+
+    if len(image_bytes) > max_bytes:
+        raise KoukoutuApiError(f"图像压缩后仍超过上传大小上限（{len(image_bytes)} 字节）", 413)
+    return filename, image_bytes, mime_type
+
+
+def reuse_encoded(data, model_key, max_bytes=UPLOAD_MAX_BYTES):
+    """
+    Upload already encoded image bytes as they are, when they fit the policy
+
+    Only the image header is read. Bytes in a supported format, within the
+    size limit and the policy max_side, are sent without decoding or
+    re-encoding.
+
+    Args:
+        data: encoded image bytes, e.g. a previous Koukoutu result
+        model_key: model the image is sent to
+        max_bytes: upload size limit
+
+    Returns:
+        tuple: (filename, bytes, mime type), or None if the image has to be re-encoded
+    """
+    if len(data) > max_bytes:
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as header:
+            image_format = header.format
+            size = header.size
+    except OSError:
+        return None
+    max_side = get_upload_policy(model_key).get("max_side")
+    if image_format not in _FORMATS or (max_side and max(size) > max_side):
+        return None
+    filename, mime_type = _FORMATS[image_format]
+    return filename, data, mime_type
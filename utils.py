@@ -6,13 +6,34 @@ import torch
 import numpy as np
 from PIL import Image
 import io
+import hashlib
 import tempfile
 import os
-import requests
+import threading
+import weakref
 
+from .client import http_get
 from .config import CODE_DICT as code_dict  # 兼容各节点原有 import
 
 
+def quantize_tensor(tensor):
+    """
+    Quantize a ComfyUI image tensor to uint8, exactly as it is uploaded
+    
+    The whole tensor is clamped, scaled, rounded to nearest and cast on its
+    own device; a GPU batch therefore crosses to the host as uint8, a quarter
+    of the float32 bytes, and the arithmetic runs vectorized on the device.
+    
+    Args:
+        tensor: ComfyUI image tensor with values 0-1
+        
+    Returns:
+        numpy.ndarray: uint8 array with the same shape
+    """
+    pixels = tensor.detach().clamp(0.0, 1.0).mul_(255.0).round_().to(torch.uint8)
+    return pixels.cpu().numpy()
+
+
 def tensor_to_pil(tensor):
     """
     Convert ComfyUI image tensor to PIL Image
@@ -30,27 +51,246 @@ def tensor_to_pil(tensor):
         image_tensor = tensor
         
     # Convert from tensor to numpy array and scale to 0-255
-    image_np = (image_tensor.cpu().numpy() * 255).astype(np.uint8)
+    image_np = quantize_tensor(image_tensor)
     return Image.fromarray(image_np)
 
 
-def pil_to_tensor(pil_image):
+def _rgb_or_rgba(pil_image):
+    if pil_image.mode in ('RGB', 'RGBA'):
+        return pil_image
+    if pil_image.has_transparency_data:
+        return pil_image.convert('RGBA')
+    return pil_image.convert('RGB')
+
+
+def pil_to_tensor(pil_image, out=None, alpha_out=None):
     """
     Convert PIL Image to ComfyUI tensor format
     
+    The color channels are converted to float in a single pass, straight into
+    the storage of the returned tensor (or of out, e.g. a slot of a larger
+    batch). Transparency is never carried in the IMAGE; it is written to
+    alpha_out when given, as a ComfyUI MASK (1 on transparent pixels, like
+    the MASK of LoadImage).
+    
     Args:
         pil_image: PIL Image
+        out: optional float32 CPU tensor [1, height, width, 3] to write into
+        alpha_out: optional float32 CPU tensor [1, height, width] for the
+                   transparency MASK
         
     Returns:
-        tensor: ComfyUI image tensor [1, height, width, channels] with values 0-1
+        tensor: ComfyUI image tensor [1, height, width, 3] with values 0-1
+    """
+    pil_image = _rgb_or_rgba(pil_image)
+    if out is None:
+        width, height = pil_image.size
+        out = torch.empty((1, height, width, 3), dtype=torch.float32)
+
+    pixels = np.asarray(pil_image)
+    np.divide(pixels[:, :, :3], 255.0, out=out[0].numpy(), dtype=np.float32)
+    if alpha_out is not None:
+        if pixels.shape[2] == 4:
+            transparency = alpha_out[0].numpy()
+            np.divide(pixels[:, :, 3], 255.0, out=transparency, dtype=np.float32)
+            np.subtract(1.0, transparency, out=transparency)
+        else:
+            alpha_out.fill_(0.0)
+    return out
+
+
+def join_alpha(image, mask):
+    """
+    Attach a ComfyUI MASK to an IMAGE batch as its alpha channel
+
+    Same convention as ComfyUI's JoinImageWithAlpha: the MASK is 1 on
+    transparent pixels (as output by LoadImage or a Koukoutu alpha output).
+
+    Args:
+        image: ComfyUI image tensor [batch, height, width, channels]
+        mask: MASK [batch or 1, height, width] or [height, width]
+
+    Returns:
+        tensor: RGBA image tensor [batch, height, width, 4]
     """
-    # Ensure image has RGBA channels for transparency support
-    if pil_image.mode != 'RGBA':
-        pil_image = pil_image.convert('RGBA')
+    if mask.dim() == 2:
+        mask = mask.unsqueeze(0)
+    if tuple(mask.shape[1:]) != tuple(image.shape[1:3]):
+        raise ValueError(f"alpha 尺寸 {tuple(mask.shape[1:])} 与 image 尺寸 {tuple(image.shape[1:3])} 不一致")
+    if mask.shape[0] not in (1, image.shape[0]):
+        raise ValueError(f"alpha 数量 {mask.shape[0]} 与 image 数量 {image.shape[0]} 不一致")
+    alpha = 1.0 - mask.to(device=image.device, dtype=image.dtype)
+    alpha = alpha.expand(image.shape[0], -1, -1).unsqueeze(-1)
+    return torch.cat((image[..., :3], alpha), dim=-1)
+
+
+def decode_image(data):
+    """
+    Decode encoded image bytes into a loaded PIL Image
     
-    # Convert PIL Image to tensor format
-    image_np = np.array(pil_image).astype(np.float32) / 255.0
-    return torch.from_numpy(image_np).unsqueeze(0)  # Add batch dimension
+    Args:
+        data: encoded image bytes (wrapped without copying)
+        
+    Returns:
+        PIL Image
+    """
+    pil_image = Image.open(io.BytesIO(data))
+    pil_image.load()
+    return pil_image
+
+
+def is_image_data(data):
+    """
+    Whether encoded bytes start with an image header PIL recognizes
+
+    Only the header is parsed, so this is cheap enough to run on every
+    response before it is cached or written to disk.
+    """
+    try:
+        Image.open(io.BytesIO(data))
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return False
+    return True
+
+
+def _digest_pixels(pixels):
+    if pixels.ndim == 2:
+        pixels = pixels[:, :, None]
+    digest = hashlib.blake2b(str(pixels.shape).encode(), digest_size=16)
+    digest.update(np.ascontiguousarray(pixels).data)
+    return digest.hexdigest()
+
+
+_fingerprints = {}
+_fingerprints_lock = threading.Lock()
+
+
+def batch_fingerprints(tensor, pixels=None):
+    """
+    Per-image content digests of a ComfyUI IMAGE batch
+    
+    The uint8-quantized pixels (what actually gets uploaded) are hashed with
+    BLAKE2b. Results are memoized per tensor object and invalidated when the
+    tensor is modified in place, so repeated checks of the same upstream
+    output are nearly free.
+    
+    Args:
+        tensor: ComfyUI image tensor [batch, height, width, channels]
+        pixels: quantize_tensor of the batch, if the caller already has it
+        
+    Returns:
+        list: hex digest of every image in the batch
+    """
+    key = id(tensor)
+    version = (tensor._version, tensor.data_ptr(), tuple(tensor.shape), tensor.dtype)
+    with _fingerprints_lock:
+        entry = _fingerprints.get(key)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+
+    if pixels is None:
+        pixels = quantize_tensor(tensor if len(tensor.shape) == 4 else tensor.unsqueeze(0))
+    digests = [_digest_pixels(image) for image in pixels]
+    with _fingerprints_lock:
+        if key not in _fingerprints:
+            weakref.finalize(tensor, _fingerprints.pop, key, None)
+        _fingerprints[key] = (version, digests)
+    return digests
+
+
+def tensor_fingerprint(tensor):
+    """
+    Content digest of a whole ComfyUI IMAGE batch (see batch_fingerprints)
+    
+    Args:
+        tensor: ComfyUI image tensor
+        
+    Returns:
+        str: hex digest
+    """
+    return hashlib.blake2b("".join(batch_fingerprints(tensor)).encode(), digest_size=16).hexdigest()
+
+
+def split_batch(tensor):
+    """
+    Split a ComfyUI IMAGE batch into single-image tensors
+    
+    Args:
+        tensor: ComfyUI image tensor [batch, height, width, channels]
+        
+    Returns:
+        list: tensors of shape [1, height, width, channels]
+    """
+    if len(tensor.shape) != 4:
+        return [tensor.unsqueeze(0)]
+    return [tensor[i:i + 1] for i in range(tensor.shape[0])]
+
+
+def _item_size(item):
+    if isinstance(item, Image.Image):
+        width, height = item.size
+        return height, width
+    return tuple(item.shape[1:3])
+
+
+def stack_batch(items, with_alpha=False):
+    """
+    Reassemble single images into one RGB IMAGE batch
+    
+    Results of different sizes are padded (bottom/right, black) to the
+    largest height and width. PIL Images are decoded straight into their
+    slot of the batch, without an intermediate tensor.
+    
+    Args:
+        items: list of tensors [1, height, width, channels] or PIL Images
+        with_alpha: also return the transparency of every item as a MASK
+        
+    Returns:
+        tuple: (IMAGE batch [batch, H, W, 3], MASK [batch, H, W] with 1 on
+                valid pixels and 0 on padding, alpha MASK [batch, H, W] or
+                None; in ComfyUI's convention 1 means transparent, so opaque
+                items get 0 and padding gets 1)
+    """
+    sizes = [_item_size(item) for item in items]
+    max_h = max(size[0] for size in sizes)
+    max_w = max(size[1] for size in sizes)
+
+    # 尺寸一致时没有填充区域，不必先清零
+    padded = any(size != (max_h, max_w) for size in sizes)
+    allocate = torch.zeros if padded else torch.empty
+    batch = allocate((len(items), max_h, max_w, 3), dtype=torch.float32)
+    mask = torch.zeros((len(items), max_h, max_w), dtype=torch.float32)
+    alpha = (torch.ones if padded else torch.empty)((len(items), max_h, max_w), dtype=torch.float32) if with_alpha else None
+    for i, (item, (h, w)) in enumerate(zip(items, sizes)):
+        alpha_out = alpha[i:i + 1, :h, :w] if with_alpha else None
+        if isinstance(item, Image.Image):
+            pil_to_tensor(item, out=batch[i:i + 1, :h, :w, :], alpha_out=alpha_out)
+        else:
+            batch[i, :h, :w] = item[0, :, :, :3]
+            if alpha_out is not None:
+                if item.shape[3] == 4:
+                    torch.sub(1.0, item[0, :, :, 3], out=alpha_out[0])
+                else:
+                    alpha_out.fill_(0.0)
+        mask[i, :h, :w] = 1.0
+    return batch, mask, alpha
+
+
+def encode_image(pil_image, format='PNG', **save_kwargs):
+    """
+    Encode PIL image in memory
+    
+    Args:
+        pil_image: PIL Image to encode
+        format: Image format (PNG, JPEG, etc.)
+        **save_kwargs: extra encoder options passed to PIL.Image.save
+        
+    Returns:
+        bytes: Encoded image
+    """
+    buffer = io.BytesIO()
+    pil_image.save(buffer, format, **save_kwargs)
+    return buffer.getvalue()
 
 
 def save_temp_image(pil_image, format='PNG'):
@@ -89,21 +329,23 @@ def validate_api_key(api_key):
     """
     Validate API key format
     
+    An empty key selects the key pool (see keypool.py) when one is configured.
+    
     Args:
         api_key: API key string
         
     Returns:
-        str: Cleaned API key
+        str: Cleaned API key, or keypool.POOL_API_KEY
         
     Raises:
         ValueError: If API key is invalid
     """
-    if not api_key or not isinstance(api_key, str):
-        raise ValueError("API Key 不能为空")
-    
-    cleaned_key = api_key.strip()
+    cleaned_key = api_key.strip() if isinstance(api_key, str) else ""
     if not cleaned_key:
-        raise ValueError("API Key 不能为空")
+        from .keypool import POOL_API_KEY, get_key_pool
+        if len(get_key_pool()):
+            return POOL_API_KEY
+        raise ValueError("API Key 不能为空（或通过 KOUKOUTU_API_KEYS / Key 文件配置 Key 池）")
     
     return cleaned_key
 
@@ -139,7 +381,7 @@ def handle_api_response(response):
             raise Exception(f"API 错误: {json_response['error']}")
         elif 'url' in json_response:
             # Download image from URL
-            image_response = requests.get(json_response['url'], timeout=30)
+            image_response = http_get(json_response['url'], timeout=30)
             if image_response.status_code != 200:
                 raise Exception(f"下载处理后的图像失败: {image_response.status_code}")
             return image_response.content